@@ -0,0 +1,321 @@
+import os
+import sys
+import json
+import time
+import zlib
+import random
+import shutil
+import string
+import argparse
+import functools
+import itertools
+import contextlib
+import tempfile
+import multiprocessing
+from io import BytesIO
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from PIL import Image, ImageDraw
+
+try:
+    import resource # Not available on Windows, CPU and RSS are left out there
+except ImportError:
+    resource = None
+
+from src import airline_logos as scraper
+from src.fr24_scraper import get_fr24_map
+from src.http_session import redirect_hosts
+from src.image_utils import RB_PLACEHOLDER_PATH
+from src.metrics import metrics
+from src.progress import ProgressRenderer
+from sync_to_repo import sync_folders
+
+FR24_INDEX = ("www.flightradar24.com", "/data/airlines/")
+FR24_CDN = "cdn.flightradar24.com"
+
+# Phase metrics where lower is better, everything else is higher is better
+LOWER_IS_BETTER = ("seconds", "cpu_s", "p50_ms", "p99_ms")
+
+
+def synthetic_codes(count):
+    """count distinct (IATA, ICAO) pairs: AAA, AAB, ... with a made up IATA."""
+    letters = string.ascii_uppercase
+    codes = []
+    for i in range(min(count, 26 ** 3)):
+        icao = letters[i // 676 % 26] + letters[i // 26 % 26] + letters[i % 26]
+        iata = letters[i % 26] + string.digits[i // 26 % 10]
+        codes.append((iata, icao))
+    return codes
+
+
+def pick_content(host, path):
+    # Deterministic per URL, so every run (and the baseline) sees the same mix
+    roll = zlib.crc32(f"{host}{path}".encode()) % 100
+    if roll < 55:
+        return 'logo'
+    if roll < 62:
+        return 'blank'
+    if roll < 66:
+        return '1x1'
+    if roll < 70:
+        return 'placeholder' if '/airlines/sq/' in path else 'logo'
+    return 'missing'
+
+
+@functools.lru_cache(maxsize=None)
+def render(kind, seed):
+    """PNG bytes for a kind of response; every seed gets its own logo."""
+    if kind == 'placeholder':
+        with open(RB_PLACEHOLDER_PATH, 'rb') as f:
+            return f.read()
+    if kind == '1x1':
+        img = Image.new('RGBA', (1, 1), (0, 0, 0, 0))
+    elif kind == 'blank':
+        img = Image.new('RGBA', (180, 60), (255, 255, 255, 255))
+    else:
+        rng = random.Random(seed)
+        img = Image.new('RGBA', (180, 60), (255, 255, 255, 0))
+        draw = ImageDraw.Draw(img)
+        for _ in range(8):
+            x, y = rng.randrange(160), rng.randrange(45)
+            box = (x, y, x + rng.randrange(10, 60), y + rng.randrange(8, 30))
+            colour = tuple(rng.randrange(256) for _ in range(3)) + (255,)
+            (draw.ellipse if rng.random() < 0.5 else draw.rectangle)(box, fill=colour)
+    buffer = BytesIO()
+    img.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def fr24_index(codes):
+    # Same table layout as the real page, for 80% of the airlines
+    rows = "".join(
+        f'<tr><td>{i}</td><td><img data-bn-lazy-src="https://{FR24_CDN}/assets/airlines/logotypes/{iata}_{icao}.png"></td>'
+        f'<td>Airline {icao}</td><td>{iata} / {icao}</td><td></td><td></td></tr>\n'
+        for i, (iata, icao) in enumerate(codes) if zlib.crc32(icao.encode()) % 10 < 8
+    )
+    return f"<html><body><table>\n{rows}</table></body></html>".encode()
+
+
+class MockCDN(ThreadingHTTPServer):
+    """
+    Stand-in for every source host, requests arrive as /<host>/<path> (see http_session.redirect_hosts).
+    Serves logos, blanks, 1x1s, the RadarBox placeholder and 404/403s, with latency and 429 bursts.
+    """
+    daemon_threads = True
+
+    def __init__(self, codes, latency, burst_every, burst_length):
+        super().__init__(("127.0.0.1", 0), MockHandler)
+        self.latency = latency
+        self.burst_every = burst_every
+        self.burst_length = burst_length
+        self.requests = itertools.count()
+        self.fr24_index = fr24_index(codes)
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # Keep-alive, like the real CDNs
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        cdn = self.server
+        host, _, path = self.path.lstrip("/").partition("/")
+        path = "/" + path
+        if cdn.latency:
+            time.sleep(cdn.latency * random.uniform(0.5, 1.5))
+        if (host, path) == FR24_INDEX:
+            # Never throttled: without the index the scrape phases would skip FR24 and not compare with a baseline
+            body, content_type = cdn.fr24_index, "text/html; charset=utf-8"
+        elif cdn.burst_every and next(cdn.requests) % cdn.burst_every < cdn.burst_length:
+            return self.reply(429, b"", {"Retry-After": "1"})
+        else:
+            kind = pick_content(host, path)
+            if kind == 'missing':
+                # FlightRadar24 answers 403 for logos it doesn't have
+                return self.reply(403 if host == FR24_CDN else 404, b"")
+            body, content_type = render(kind, host + path), "image/png"
+        etag = f'"{zlib.crc32(body):08x}"'
+        if self.headers.get("If-None-Match") == etag:
+            return self.reply(304, b"", {"ETag": etag})
+        self.reply(200, body, {"ETag": etag, "Content-Type": content_type})
+
+    def reply(self, status, body, headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def serve(port_queue, codes, latency, burst_every, burst_length):
+    # Runs in its own process so the server's CPU doesn't count against the scraper
+    server = MockCDN(codes, latency, burst_every, burst_length)
+    port_queue.put(server.server_address[1])
+    server.serve_forever()
+
+
+def cpu_time():
+    if resource is None:
+        return None
+    own, children = resource.getrusage(resource.RUSAGE_SELF), resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def measure(fn):
+    """Run fn, returns (its result, {"seconds", "cpu_s"})."""
+    cpu = cpu_time()
+    started = time.perf_counter()
+    result = fn()
+    phase = {"seconds": time.perf_counter() - started}
+    if cpu is not None:
+        phase["cpu_s"] = cpu_time() - cpu
+    return result, phase
+
+
+def run_scraper(codes, options, fr24_map):
+    scraper.args = scraper.parse_args(["-A"] + options)
+    for source in scraper.sources:
+        source['enable'] = True
+        os.makedirs(source['dir'], exist_ok=True)
+    scraper.fr24_map.clear()
+    scraper.fr24_map.update(fr24_map)
+    scraper.fr24_ready.set()
+    scraper.total_airlines = 0
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        scraper.renderer = ProgressRenderer(scraper.footer_lines, stream=devnull)
+        scraper.execute_scraper(codes)
+
+
+def scrape_phase(codes, options, fr24_map):
+    _, phase = measure(lambda: run_scraper(codes, options, fr24_map))
+    report = metrics.report()
+    requests = sum(
+        count for source in report["sources"].values()
+        for outcome, count in source.get("outcomes", {}).items() if outcome.isdigit()
+    )
+    latency = metrics.summary("ttfb")
+    phase.update(requests=requests, req_per_s=requests / phase["seconds"])
+    if latency["count"]:
+        phase.update(p50_ms=latency["p50"] * 1000, p99_ms=latency["p99"] * 1000)
+    return phase
+
+
+def quietly(fn, *args, **kwargs):
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        return fn(*args, **kwargs)
+
+
+def run_benchmark(args):
+    codes = synthetic_codes(args.codes)
+    options = ["-t", str(args.threads), "-d", str(args.delay), "--engine", args.engine,
+               "--host-limit", str(args.host_limit), "--validate-procs", str(args.validate_procs)]
+    results = {}
+
+    fr24_map, results["fr24 index (cold)"] = measure(lambda: quietly(get_fr24_map))
+    _, results["fr24 index (cached)"] = measure(lambda: quietly(get_fr24_map))
+    results["scrape (cold)"] = scrape_phase(codes, options, fr24_map)
+    results["scrape (warm)"] = scrape_phase(codes, options, fr24_map)
+
+    os.makedirs("target", exist_ok=True)
+    _, results["sync (cold)"] = measure(lambda: quietly(sync_folders, ".", "target", jobs=args.jobs))
+    _, results["sync (warm)"] = measure(lambda: quietly(sync_folders, ".", "target", jobs=args.jobs))
+
+    rss = peak_rss_mb()
+    return {
+        "settings": vars(args),
+        "phases": results,
+        "peak_rss_mb": rss,
+    }
+
+
+def print_results(results, baseline=None, tolerance=0.1):
+    """Print every phase, against the baseline if there is one. Returns the regressions found."""
+    regressions = []
+    base_phases = baseline["phases"] if baseline else {}
+    print(f"{'phase':<22}{'metric':<12}{'value':>12}" + (f"{'baseline':>12}{'change':>10}" if baseline else ""))
+    print("-" * (46 + (22 if baseline else 0)))
+    for name, phase in results["phases"].items():
+        for metric, value in phase.items():
+            line = f"{name:<22}{metric:<12}{value:>12.2f}"
+            base = base_phases.get(name, {}).get(metric)
+            if base:
+                change = (value - base) / base
+                worse = change > tolerance if metric in LOWER_IS_BETTER else change < -tolerance
+                line += f"{base:>12.2f}{change:>+10.1%}"
+                if worse and metric in ("seconds", "req_per_s"):
+                    line += "  REGRESSION"
+                    regressions.append((name, metric))
+            print(line)
+    if results["peak_rss_mb"] is not None:
+        print(f"Peak RSS: {results['peak_rss_mb']:.1f} MB")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the scraper offline against a local mock CDN.")
+    parser.add_argument("--codes", type=int, default=2000, help="Number of synthetic airlines (default: 2000)")
+    parser.add_argument("-t", "--threads", type=int, default=16, help="Scraper threads (default: 16)")
+    parser.add_argument("-d", "--delay", type=float, default=0.01, help="Scraper starting delay, see main.py (default: 0.01)")
+    parser.add_argument("--engine", choices=["thread", "async"], default="thread", help="Scraper engine (default: thread)")
+    parser.add_argument("--host-limit", type=int, default=20, help="Per-host limit for the async engine (default: 20)")
+    parser.add_argument("--validate-procs", type=int, default=0, help="Scraper validate processes (default: 0)")
+    parser.add_argument("-j", "--jobs", type=int, default=1, help="sync_to_repo processes (default: 1)")
+    parser.add_argument("--latency", type=float, default=20, help="Mock CDN latency per request in ms, +-50%% jitter (default: 20)")
+    parser.add_argument("--burst-every", type=int, default=0, help="Answer 429 to a burst of requests every N requests, 0 disables (default: 0)")
+    parser.add_argument("--burst-length", type=int, default=20, help="Requests per 429 burst (default: 20)")
+    parser.add_argument("--save-baseline", metavar="PATH", help="Save the results as a baseline JSON file")
+    parser.add_argument("--baseline", metavar="PATH", help="Compare against a saved baseline, exits 1 on a regression")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Relative change counted as a regression (default: 0.1)")
+    parser.add_argument("--keep", action="store_true", help="Keep the temporary working directory")
+    args = parser.parse_args()
+
+    # Paths are given relative to where we were started, the run happens in a scratch directory
+    save_path = os.path.abspath(args.save_baseline) if args.save_baseline else None
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    port_queue = multiprocessing.Queue()
+    server = multiprocessing.Process(
+        target=serve, args=(port_queue, synthetic_codes(args.codes), args.latency / 1000, args.burst_every, args.burst_length),
+        daemon=True)
+    server.start()
+    redirect_hosts(f"http://127.0.0.1:{port_queue.get(timeout=30)}")
+
+    workdir = tempfile.mkdtemp(prefix="logo-bench-")
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        results = run_benchmark(args)
+    finally:
+        os.chdir(cwd)
+        server.terminate()
+        redirect_hosts(None)
+        if args.keep:
+            print(f"Working directory kept: {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"{args.codes} airlines, {args.engine} engine, {args.threads} threads, {args.latency:g} ms latency")
+    regressions = print_results(results, baseline, args.tolerance)
+    if save_path:
+        with open(save_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline saved to {save_path}")
+    if regressions:
+        print(f"{len(regressions)} regression(s) beyond {args.tolerance:.0%}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
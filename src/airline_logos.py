@@ -1,43 +1,70 @@
 import os
+import sys
 import requests
-from PIL import Image
-from io import BytesIO
 import threading
-import time
+import multiprocessing
 import concurrent.futures
-from .airline_opp_codes import get_airline_codes
-from .fr24_scraper import get_fr24_map
-from PIL import ImageChops
-from .config import HEADERS
+import numpy as np
+from .airline_opp_codes import iter_airline_codes
+from .fr24_scraper import iter_fr24_map, URL as FR24_URL
+from .http_session import configure_pool, get_session, close_sessions, resolve_url
+from . import logo_cache
+from .logo_cache import get_cache, close_caches
+from .dir_index import get_dir_index, reset_dir_indexes
+from .image_utils import analyse_images, placeholder_fingerprint, placeholder_image
+from .phash import PlaceholderIndex, dhash
+from .file_utils import write_atomic
+from .pipeline import Pipeline
+from .progress import Counters, ProgressRenderer
+from .metrics import metrics
+from .rate_limit import configure_limits, get_limiter, limiter_rates
+from .journal import Journal
+from .blob_store import BlobStore
+from .config import CODES_CACHE_TTL
+from .sources import SOURCES, SOURCES_BY_NAME, host_of, url_builder
+import hashlib
+import time
 import argparse
 
-FA_LOGOS = "FlightAware Logos"
-RB_BANNERS = "RadarBox Banners"
-RB_LOGOS = "RadarBox Logos"
-FR24_LOGOS = "FlightRadar24 Logos"
-AVCODES_UK_BANNERS = "Avcodes UK Banners"
-sources = [
-    {"name": FA_LOGOS, "dir": "flightaware_logos", },
-    {"name": RB_BANNERS, "dir": "radarbox_banners"},
-    {"name": RB_LOGOS, "dir": "radarbox_logos"},
-    {"name": FR24_LOGOS, "dir": "fr24_logos"},
-    {"name": AVCODES_UK_BANNERS, "dir": "avcodes_banners"},
-]
+# This run's copy of the source registry, 'enable' is set from the prompts or -A
+sources = [dict(source) for source in SOURCES]
 
 # Global Args placeholder (initialized in main)
 args = None
 fr24_map = {}
-airline_codes = []
-
-def main():
-    global args, fr24_map
+fr24_ready = threading.Event() # Set once the FR24 index has been fully parsed
+FR24_PENDING = object() # Placeholder url for FR24 jobs whose ICAO isn't in the map yet
+total_airlines = 0
+code_table = None # CodeTable of the current run, filled by discover_codes
+journal = None
+blob_store = None
+placeholder_index = None
+validate_pool = None # Process pool for decoding and checking images (--validate-procs)
+
+def parse_args(argv=None):
     parser = argparse.ArgumentParser(description='Airline Logo Scraper')
     parser.add_argument('-A', '--all', action='store_true', help='Download from all sources without prompting')
     parser.add_argument('-t', '--threads', type=int, default=10, help='Number of threads (default: 10)')
-    parser.add_argument('-d', '--delay', type=float, default=0.5, help='Delay between requests in seconds (default: 0.5)')
+    parser.add_argument('-d', '--delay', type=float, default=0.5, help='Starting delay between requests per thread in seconds, each host then adapts its own rate (default: 0.5)')
     parser.add_argument('-s', '--skip', action='store_true', help='Skip already downloaded files')
+    parser.add_argument('--engine', choices=['thread', 'async'], default='thread', help='Download engine: "thread" (default) uses a thread pool, "async" runs all fetches as coroutines')
+    parser.add_argument('--host-limit', type=int, default=20, help='Max in-flight requests per host for the async engine (default: 20)')
+    parser.add_argument('--resume', action='store_true', help='Continue an interrupted run from its journal, only unfinished downloads are scheduled')
+    parser.add_argument('--refresh-codes', action='store_true', help='Scrape the airline code list again even if the cached copy is fresh')
+    parser.add_argument('--cas', action='store_true', help='Keep logos in a content-addressed store (.blobs) and hardlink them into the source folders')
+    parser.add_argument('--placeholder-cluster', type=int, default=25, help='Treat an image as a placeholder once near-identical copies come from this many ICAOs of one source, 0 disables (default: 25)')
+    parser.add_argument('--placeholder-ttl', type=float, default=30, help='Days to keep a placeholder learned from a cluster before giving its image another chance, 0 forgets them all (default: 30)')
+    parser.add_argument('--validate-procs', type=int, default=0, help='Decode and check images in this many worker processes instead of the validate threads, 0 disables (default: 0)')
+    parser.add_argument('--reencode', action='store_true', help='Re-encode logos through Pillow instead of saving the original bytes')
+    parser.add_argument('--miss-ttl', type=float, default=7, help='Days to trust a recorded miss (404/403, blank, placeholder) before asking again, 0 disables (default: 7)')
+    parser.add_argument('--report', metavar='PATH', help='Write a JSON run report (latency histograms, outcomes, retries per source) to PATH')
+    parser.add_argument('--prom', metavar='PATH', help='Write the run metrics to PATH in the Prometheus text format')
     parser.add_argument('--fr24-method', choices=['brute', 'scrape'], default='scrape', help='Method for FlightRadar24: "scrape" (default) parses their index, "brute" guesses URLs')
-    args = parser.parse_args()
+    return parser.parse_args(argv)
+
+def main():
+    global args
+    args = parse_args()
 
     # Initialize FR24 map if needed
     if args.fr24_method == 'scrape':
@@ -55,13 +82,26 @@ def main():
             os.makedirs(source_folder, exist_ok=True)
 
     # Load FR24 map if enabled and using scrape method
-    fr24_enabled = any(s['name'] == FR24_LOGOS and s['enable'] for s in sources)
+    fr24_enabled = any(s['index'] == 'fr24' and s['enable'] for s in sources)
     if fr24_enabled and args.fr24_method == 'scrape':
-        fr24_map = get_fr24_map()
+        # Stream the index in the background, downloads start while it is still being parsed
+        threading.Thread(target=load_fr24_map, name="fr24-index", daemon=True).start()
+    else:
+        fr24_ready.set()
 
     # START EXECUTION
     execute_scraper()
 
+def load_fr24_map():
+    # Runs in the background while the renderer owns stdout, everything goes through print_log
+    print_log(f"Scraping {FR24_URL} for logo map...")
+    try:
+        for icao, url in iter_fr24_map(log=print_log):
+            fr24_map[icao] = url
+    finally:
+        fr24_ready.set()
+    print_log(f"Found {len(fr24_map)} airlines with logos from FR24 index.")
+
 def execute_scraper():
     pass # Holder, will be wrapped below by moving code
 
@@ -69,305 +109,523 @@ def execute_scraper():
 
 
 
-def is_blank(img):
-    # Compare the image with a blank image of the same size
-    blank = Image.new(img.mode, img.size, img.getpixel((0, 0)))
-    diff = ImageChops.difference(img, blank)
-    
-    # Check if any band has non-zero difference using getextrema
-    # getbbox() handles RGBA poorly (ignores RGB diffs if Alpha diff is 0)
-    for band in diff.split():
-        if band.getextrema() != (0, 0):
-            return False # The image is not blank
-            
-    return True  # The image is blank
+MAX_RETRIES = 5
+VALIDATE_BATCH = 32 # Most responses checked together by one validate worker
 
-def images_are_same(img1, img2):
-    # Check if images have the same size and mode
-    if img1.size != img2.size or img1.mode != img2.mode:
-        return False  # The images are different
+def fetch_logo(url, logo_file_path, icao_code):
+    """Single GET through the shared per-host session, raises requests.RequestException on failure."""
+    return get_session(url).get(resolve_url(url), headers=get_request_headers(logo_file_path, icao_code), timeout=10)
 
-    # Compare two images to see if they are the same
-    diff = ImageChops.difference(img1, img2)
-    
-    # Check if any band has non-zero difference
-    for band in diff.split():
-        if band.getextrema() != (0, 0):
-            return False # The images are different
-            
-    return True  # The images are the same
+def get_request_headers(logo_file_path, icao_code):
+    # Revalidate logos we already have instead of downloading them again
+    directory, filename = os.path.split(logo_file_path)
+    if filename not in get_dir_index(directory):
+        return {}
+    return get_cache(directory).conditional_headers(icao_code)
 
+def handle_response(status_code, content, headers, logo_file_path, source, icao_code):
+    # Validate and store in one go, used by the async engine off the event loop
+    data, outcome = validate_response(status_code, content, logo_file_path, source, icao_code)
+    if data is not None:
+        outcome = store_logo(data, content, headers, logo_file_path, source, icao_code)
+    finish_job(icao_code, source, outcome)
 
+def finish_job(icao_code, source, outcome):
+    # Errors leave no journal entry so a resumed run tries them again
+    if outcome and journal:
+        journal.record(icao_code, source, outcome)
 
+def validate_response(status_code, content, logo_file_path, source, icao_code):
+    """
+    Check a response, returns (bytes to save or None, outcome).
+    Misses are recorded here; outcome is None when the download failed and should be retried later.
+    """
+    return validate_responses([(status_code, content, logo_file_path, source, icao_code)])[0]
 
-def save_pic(url, logo_file_path, source, icao_code):
+def validate_responses(responses):
+    """
+    validate_response for a batch of (status_code, content, logo_file_path, source, icao_code).
+    Decoding and the image checks run as one analyse_images call, in validate_pool if there is one.
+    """
+    results = [(None, None)] * len(responses)
+    fetched = [] # indexes of 200 responses
+    for i, (status_code, content, logo_file_path, source, icao_code) in enumerate(responses):
+        try:
+            if status_code == 304:
+                results[i] = None, 'unchanged' # Unchanged since the last saved download
+            elif status_code == 200:
+                fetched.append(i)
+            else:
+                # 404, or whatever else the source answers for airlines it has no logo for
+                if status_code in SOURCES_BY_NAME[source]['miss_status']:
+                    get_cache(os.path.dirname(logo_file_path)).record_miss(icao_code, str(status_code))
+                    results[i] = None, str(status_code)
+                else:
+                    print_log(f"{status_code} for {icao_code} {source}")
+        except Exception as e:
+            print_log(f"Error downloading {icao_code} from {source}: {e}")
+    if not fetched:
+        return results
+
+    batch = ([responses[i][1] for i in fetched], [SOURCES_BY_NAME[responses[i][3]]['placeholder'] for i in fetched], args.reencode)
     try:
-        response = None
-        max_retries = 5
-        for attempt in range(max_retries + 1):
+        if validate_pool:
+            analysed = validate_pool.submit(analyse_images, *batch).result()
+        else:
+            analysed = analyse_images(*batch)
+    except Exception as e:
+        print_log(f"Error validating {len(fetched)} downloads: {e}")
+        return results
+
+    # Near-duplicate check against the known placeholders, one hash matrix per source
+    known = {}
+    candidates = [k for k, (error, reason, _, _, _) in enumerate(analysed) if not error and not reason]
+    for source in {responses[fetched[k]][3] for k in candidates}:
+        members = [k for k in candidates if responses[fetched[k]][3] == source]
+        hashes = np.array([analysed[k][2] for k in members], dtype=np.uint64)
+        known.update(zip(members, placeholder_index.known_mask(source, hashes)))
+
+    for k, i in enumerate(fetched):
+        _, content, logo_file_path, source, icao_code = responses[i]
+        error, reject_reason, hash_value, png, (decode_time, validate_time) = analysed[k]
+        metrics.observe('decode', source, decode_time)
+        metrics.observe('validate', source, validate_time)
+        if error:
+            print_log(f"Error downloading {icao_code} from {source}: {error}")
+            metrics.count('error', source)
+            continue
+        if not reject_reason and known[k]:
+            reject_reason = 'placeholder'
+        if not reject_reason:
+            # Learn it, a cluster of near-identical images is a placeholder too
+            is_placeholder, earlier = placeholder_index.learn(source, hash_value, (icao_code, logo_file_path))
+            if earlier:
+                drop_placeholders(source, earlier)
+            if is_placeholder:
+                reject_reason = 'placeholder'
+        if reject_reason:
+            # print_log(f"{reject_reason} image received for {icao_code} from {source}, not saved.")
+            get_cache(os.path.dirname(logo_file_path)).record_miss(icao_code, reject_reason)
+            metrics.count(reject_reason, source)
+            results[i] = None, reject_reason
+        else:
+            results[i] = (content if png is None else png), None
+    return results
+
+def drop_placeholders(source, members):
+    # A generic image was only recognised after some copies had been accepted, take those back.
+    # Copies still on their way to store_logo are caught there, it checks dropped_placeholders.
+    print_log(f"{source} serves a placeholder image, dropping {len(members)} earlier downloads")
+    with drop_lock:
+        for icao_code, logo_file_path in members:
+            dropped_placeholders.add((source, icao_code))
+            directory, filename = os.path.split(logo_file_path)
+            get_cache(directory).record_miss(icao_code, 'placeholder')
+            if blob_store:
+                blob_store.remove(source, icao_code)
+            index = get_dir_index(directory)
+            if filename not in index:
+                continue # Not written yet
+            index.discard(filename)
             try:
-                response = requests.get(url, headers=HEADERS, timeout=10)
-                
-                # Handle rate limiting
-                if response.status_code == 429:
-                    if attempt < max_retries:
-                        wait_time = 2 ** (attempt + 2) # 4s, 8s, 16s, 32s, 64s
-                        time.sleep(wait_time)
-                        continue
-                    else:
-                        print_log(f"Rate limit exceeded (429) for {icao_code} from {source} after retries")
-                        return
-
-                break # proceed if not 429 (success or other error handled below)
-            except requests.RequestException:
-                 if attempt < max_retries:
-                    time.sleep(1)
-                    continue
-                 raise # Re-raise if final attempt fails
-                 
-        if not response:
-             return
-
-        if response.status_code == 200:
-            img = Image.open(BytesIO(response.content))
-            if img.size != (1, 1) and not is_blank(img):  # Check for 1x1 and blank image
-                if source == RB_LOGOS:
-                    placeholder_img_path = os.path.join(os.path.dirname(__file__), 'RB_PLACERHOLDER.png')
-                    placeholder_img = Image.open(placeholder_img_path)
-                    if images_are_same(img, placeholder_img):
-                        # print_log(f"Placeholder image received for {icao_code} from {source}, not saved.")
-                        return
-                img.save(logo_file_path)
-                print_log(f"Downloaded {icao_code} from {source}")
-                with counter_lock:
-                    if source in source_counters:
-                        source_counters[source] += 1
-                    if source in total_counters:
-                        total_counters[source] += 1
-            else:
+                os.remove(logo_file_path)
+            except FileNotFoundError:
                 pass
-                # print_log(f"Placeholder or blank image received for {icao_code} from {source}, not saved.")
+            counters.add(('new', source), -1)
+            counters.add(('total', source), -1)
+
+def store_logo(data, content, headers, logo_file_path, source, icao_code):
+    """
+    Save an accepted logo. Returns the outcome: 'saved', 'placeholder' when drop_placeholders
+    flagged it in the meantime, or None if it couldn't be saved.
+    """
+    if (source, icao_code) in dropped_placeholders:
+        metrics.count('placeholder', source)
+        return 'placeholder'
+    started = time.perf_counter()
+    try:
+        content_hash = hashlib.sha256(content).hexdigest()
+        if blob_store:
+            # Hashed once here, identical artwork from several sources is stored once
+            blob_store.store(data, logo_file_path, source, icao_code,
+                             digest=content_hash if data is content else None)
         else:
-            # FlightRadar24 returns 403 for missing images, treat as 404
-            is_fr24_403 = (response.status_code == 403 and source == FR24_LOGOS)
-            if response.status_code != 404 and not is_fr24_403:
-                print_log(f"{response.status_code} for {icao_code} {source}")
+            write_atomic(logo_file_path, data)
+        directory, filename = os.path.split(logo_file_path)
+        cache = get_cache(directory)
+        with drop_lock:
+            if (source, icao_code) in dropped_placeholders:
+                # Flagged while it was being written, drop_placeholders already recorded the miss
+                os.remove(logo_file_path)
+                if blob_store:
+                    blob_store.remove(source, icao_code)
+                metrics.count('placeholder', source)
+                return 'placeholder'
+            get_dir_index(directory).add(filename)
+            if cache.is_known_miss(icao_code):
+                cache.clear_miss(icao_code)
+            cache.record(
+                icao_code, headers.get('ETag'), headers.get('Last-Modified'),
+                len(content), content_hash)
+            counters.add(('new', source))
+            counters.add(('total', source))
+        metrics.observe('write', source, time.perf_counter() - started)
+        metrics.count('saved', source)
+        print_log(f"Downloaded {icao_code} from {source}")
+        return 'saved'
     except Exception as e:
-        print_log(f"Error downloading {icao_code} from {source}: {e}")
+        print_log(f"Error saving {icao_code} from {source}: {e}")
+        metrics.count('error', source)
+        return None
 
 class AirlineCode:
+    __slots__ = ('iata_code', 'icao_code')
+
     def __init__(self, iata_code, icao_code):
         self.iata_code = iata_code
         self.icao_code = icao_code
 
-    @property
-    def flightaware_logo_download_url(self):
-        return f"https://flightaware.com/images/airline_logos/90p/{self.icao_code}.png"
-
-    @property
-    def avcodes_uk_banner_download_url(self):
-        return f"https://www.avcodes.co.uk/images/logos/{self.icao_code}.png"
-
-    @property
-    def fr24_banner_download_url(self):
-        return f"https://cdn.flightradar24.com/assets/airlines/logotypes/{self.iata_code}_{self.icao_code}.png"
-
-    @property
-    def rb_banner_download_url(self):
-        return f"https://cdn.radarbox.com/airlines/{self.icao_code}.png"
-
-    @property
-    def rb_logo_download_url(self):
-        return f"https://cdn.radarbox.com/airlines/sq/{self.icao_code}.png"
-
-
-
-
-
-
-import sys
-
-# ... (existing imports)
-
-# Shared counter for completed tasks
-# Shared counter for completed tasks
-completed_counter = 0
-source_counters = {
-    FA_LOGOS: 0,
-    RB_BANNERS: 0,
-    RB_LOGOS: 0,
-    FR24_LOGOS: 0,
-    AVCODES_UK_BANNERS: 0
-}
-total_counters = {
-    FA_LOGOS: 0,
-    RB_BANNERS: 0,
-    RB_LOGOS: 0,
-    FR24_LOGOS: 0,
-    AVCODES_UK_BANNERS: 0
-}
-counter_lock = threading.Lock()  # Lock to synchronize access to the counter
-print_lock = threading.Lock() # Lock for printing to stdout
-
-import shutil
-
-def format_name(name):
-    if "FlightAware" in name: return "FA"
-    if "RadarBox" in name:
-        return "RB Ban" if "Banners" in name else "RB Log"
-    if "FlightRadar24" in name: return "FR24"
-    if "Avcodes" in name: return "Av"
-    return name
-
-def get_stats_string(counters, prefix):
-    full_str = f"{prefix} " + " | ".join([f"{format_name(k)}:{v}" for k, v in counters.items()])
-    cols = shutil.get_terminal_size().columns
+class CodeTable:
+    """
+    The run's airline codes, de-duplicated by ICAO as they are discovered and stored as two columns
+    of interned strings. Only the discovery thread adds to it, so it needs no lock and the workers
+    never see a duplicate.
+    """
+    __slots__ = ('iata', 'icao', 'index')
+
+    def __init__(self):
+        self.iata = []
+        self.icao = []
+        self.index = {} # ICAO -> row
+
+    def add(self, iata, icao):
+        """Add a code pair, returns its row or None if the ICAO is missing or already known."""
+        # Nothing can be downloaded without an ICAO, files are named after it
+        if not icao or icao in self.index:
+            return None
+        row = len(self.icao)
+        icao = sys.intern(icao)
+        self.index[icao] = row
+        self.icao.append(icao)
+        self.iata.append(sys.intern(iata) if iata else None)
+        return row
+
+    def __len__(self):
+        return len(self.icao)
+
+    def __getitem__(self, row):
+        return AirlineCode(self.iata[row], self.icao[row])
+
+# Downloads per source this session ('new', name) and in the folder ('total', name), plus airlines done ('completed')
+counters = Counters()
+counter_lock = threading.Lock() # Guards pending_jobs
+# (source, ICAO) of downloads accepted before their image was recognised as a placeholder
+dropped_placeholders = set()
+drop_lock = threading.Lock() # Orders drop_placeholders against store_logo saving the same file
+
+def get_stats_string(snapshot, kind, prefix, cols):
+    full_str = f"{prefix} " + " | ".join([f"{s['short']}:{snapshot.get((kind, s['name']), 0)}" for s in sources])
     if len(full_str) > cols - 5:
         return full_str[:cols-5]
     return full_str
 
 def get_progress_string(count, total):
-    percent = (count / total) * 100
+    percent = (count / total) * 100 if total else 0
     return f"Progress: {count}/{total} ({percent:.2f}%)"
 
+def footer_lines(cols):
+    # Session + Total + Progress, drawn by the renderer thread
+    snapshot = counters.snapshot()
+    return [
+        get_stats_string(snapshot, 'new', "NEW DURING skip", cols),
+        get_stats_string(snapshot, 'total', "TOTAL DIR+NEW", cols),
+        get_progress_string(snapshot.get('completed', 0), total_airlines),
+    ]
+
+renderer = ProgressRenderer(footer_lines)
+
 def print_log(msg):
-    with print_lock:
-        if 'airline_codes' in globals() and len(airline_codes) > 0:
-            # Clear Line 3 (Progress)
-            sys.stdout.write('\r\033[K') 
-            # Move up and Clear Line 2 (Total Stats)
-            sys.stdout.write('\033[F\033[K')
-            # Move up and Clear Line 1 (Session Stats)
-            sys.stdout.write('\033[F\033[K')
-            
-            print(msg)
-            
-            # Redraw footer
-            total = len(airline_codes)
-            count = completed_counter
-            
-            session_str = get_stats_string(source_counters, "NEW DURING skip")
-            total_str = get_stats_string(total_counters, "TOTAL DIR+NEW")
-            prog_str = get_progress_string(count, total)
-            
-            sys.stdout.write(session_str + '\033[K\n')
-            sys.stdout.write(total_str + '\033[K\n')
-            sys.stdout.write(prog_str + '\033[K')
-        else:
-            print(msg)
-        sys.stdout.flush()
+    # Queued for the renderer thread, workers never wait on the terminal
+    renderer.log(msg)
 
 def print_progress():
-    global completed_counter
-    with counter_lock:
-        completed_counter += 1
-        count = completed_counter
-    
-    # Display progress
-    total = len(airline_codes)
-    if total > 0:
-        session_str = get_stats_string(source_counters, "NEW DURING skip")
-        total_str = get_stats_string(total_counters, "TOTAL DIR+NEW")
-        prog_str = get_progress_string(count, total)
-        
-        with print_lock:
-            # Move up to start of update region (Session + Total + Progress)
-            sys.stdout.write('\r\033[F\033[F') 
-            sys.stdout.write(session_str + '\033[K\n')
-            sys.stdout.write(total_str + '\033[K\n')
-            sys.stdout.write(prog_str + '\033[K')
-            sys.stdout.flush()
+    counters.add('completed')
 
 use_wiki_airlines = True
 if use_wiki_airlines:
-    # Global set to keep track of processed ICAO codes
-    processed_icao_codes = set()
-    processing_lock = threading.Lock()
+    # (source name, dir, miss cache, dir index, url(iata, icao)) per enabled source, compiled once by compile_dispatch
+    dispatch = []
+
+    def compile_dispatch():
+        table = []
+        for source in sources:
+            if not source['enable']:
+                continue
+            if source['index'] == 'fr24' and args.fr24_method == 'scrape':
+                url_for = fr24_index_url
+            else:
+                url_for = url_builder(source) # fr24 'brute' guesses from the template
+            table.append((source['name'], source['dir'], get_cache(source['dir']), get_dir_index(source['dir']), url_for))
+        return table
+
+    def fr24_index_url(iata, icao):
+        url = fr24_map.get(icao)
+        if url is None and not fr24_ready.is_set():
+            return FR24_PENDING # Resolved once the index has been parsed
+        return url
+
+    def get_download_jobs(code):
+        """Return (source name, url, logo file path) for every enabled source of an airline."""
+        jobs = []
+        icao = code.icao_code
+        if not icao:
+            return jobs
+        filename = f"{icao}.png"
+        for name, directory, cache, files, url_for in dispatch:
+            logo_file_path = os.path.join(directory, filename)
+            if args.skip and filename in files:
+                continue
+            # Known 404/403, blank or placeholder from an earlier run
+            if cache.is_known_miss(icao):
+                continue
+            # Already finished before the run was interrupted
+            if args.resume and journal.is_done(icao, name):
+                continue
+            url = url_for(code.iata_code, icao)
+            if url:
+                jobs.append((name, url, logo_file_path))
+        return jobs
+
+    class DownloadTask:
+        """One (airline, source) download as it moves through the pipeline stages."""
+        def __init__(self, code, source, url, logo_file_path):
+            self.code = code
+            self.source = source
+            self.url = url
+            self.logo_file_path = logo_file_path
+            self.attempts = 0
+            self.has_token = False # Holds a rate limiter reservation that has come due
+            self.response = None
+            self.data = None
+            self.outcome = None
+
+    # Sources still in flight per airline, the airline counts as done when this hits 0
+    pending_jobs = {}
+    # Set up in execute_scraper: the fetch stage (for deferred retries) and a cap on tasks in flight
+    fetch_stage = None
+    in_flight = None
+
+    # Pipeline stages: code discovery -> URL generation -> fetch -> validate -> write
+    def generate_jobs(code, emit):
+        # Codes arrive de-duplicated from discover_codes, no lock needed here
+        jobs = get_download_jobs(code)
+        if not jobs:
+            print_progress()
+            return
+        with counter_lock:
+            pending_jobs[code.icao_code] = len(jobs)
+        for source_name, url, logo_file_path in jobs:
+            # Bounds how many tasks can pile up waiting on a throttled host
+            in_flight.acquire()
+            emit(DownloadTask(code, source_name, url, logo_file_path))
+
+    def fetch_task(task, emit):
+        # Waits (rate limit, backoff) are handed to the scheduler instead of sleeping in a
+        # worker, so a throttled host never holds threads the other sources could use
+        icao_code = task.code.icao_code
+        if task.url is FR24_PENDING:
+            if not fr24_ready.is_set():
+                fetch_stage.defer(task, 0.5)
+                return
+            task.url = fr24_map.get(icao_code)
+            if task.url is None:
+                emit(task) # Not in the FR24 index, nothing to download
+                return
+
+        limiter = get_limiter(task.url)
+        if not task.has_token:
+            taken, wait = limiter.reserve()
+            if wait > 0:
+                # Without a token the task asks again when it comes due, at the rate of that moment
+                task.has_token = taken
+                fetch_stage.defer(task, wait)
+                return
+        task.has_token = False
+
+        sent = time.monotonic()
+        started = time.perf_counter()
+        try:
+            response = fetch_logo(task.url, task.logo_file_path, icao_code)
+        except requests.RequestException as e:
+            if task.attempts < MAX_RETRIES:
+                task.attempts += 1
+                metrics.retry(task.source)
+                fetch_stage.defer(task, 1)
+                return
+            print_log(f"Error downloading {icao_code} from {task.source}: {e}")
+            metrics.count('error', task.source)
+            emit(task)
+            return
+        except Exception as e:
+            print_log(f"Error downloading {icao_code} from {task.source}: {e}")
+            metrics.count('error', task.source)
+            emit(task)
+            return
+        # requests can't split DNS and connect out of elapsed (request sent -> headers parsed)
+        ttfb = response.elapsed.total_seconds()
+        metrics.observe('ttfb', task.source, ttfb)
+        metrics.observe('download', task.source, max(0.0, time.perf_counter() - started - ttfb))
+        metrics.count(response.status_code, task.source)
+
+        if response.status_code == 429 or response.status_code >= 500:
+            retry_after = limiter.on_throttle(response.headers.get('Retry-After'), sent)
+            if task.attempts < MAX_RETRIES:
+                # With Retry-After the limiter already holds the wait, otherwise back off 4s, 8s, 16s, 32s, 64s
+                wait = 0 if retry_after is not None else 2 ** (task.attempts + 2)
+                task.attempts += 1
+                metrics.retry(task.source)
+                fetch_stage.defer(task, wait)
+                return
+            if response.status_code == 429:
+                print_log(f"Rate limit exceeded (429) for {icao_code} from {task.source} after retries")
+                emit(task)
+                return
+        else:
+            limiter.on_success()
+        task.response = response
+        emit(task)
 
-    
-    def download_logo(code):
-        global processed_icao_codes
+    def validate_tasks(tasks, emit):
+        # Gets up to VALIDATE_BATCH tasks at once, their images are checked as one batch
         try:
-            with processing_lock:
-                if code.icao_code in processed_icao_codes:
-                    return  # Skip if the code has already been processed
-                processed_icao_codes.add(code.icao_code)
-            
-            # ... rest of your download_logo function ...
-            if code.icao_code:
-                request_made = False
-                for source in sources:
-                    if source['enable']:
-                        logo_file_path = os.path.join(source['dir'], f"{code.icao_code}.png")
-                        if args.skip and os.path.exists(logo_file_path):
-                             continue
-                        
-                        if source['name'] == FA_LOGOS:
-                            request_made = True
-                            url = code.flightaware_logo_download_url
-                            save_pic(url, logo_file_path, source['name'], code.icao_code)
-                        elif source['name'] == RB_BANNERS:
-                            request_made = True
-                            url = code.rb_banner_download_url
-                            save_pic(url, logo_file_path, source['name'], code.icao_code)
-                        elif source['name'] == RB_LOGOS:
-                            request_made = True
-                            url = code.rb_logo_download_url
-                            save_pic(url, logo_file_path, source['name'], code.icao_code)
-                        elif source['name'] == FR24_LOGOS:
-                            if args.fr24_method == 'scrape':
-                                if code.icao_code in fr24_map:
-                                    request_made = True
-                                    url = fr24_map[code.icao_code]
-                                    save_pic(url, logo_file_path, source['name'], code.icao_code)
-                            else: # legacy brute force
-                                if code.iata_code:
-                                    request_made = True
-                                    url = code.fr24_banner_download_url
-                                    save_pic(url, logo_file_path, source['name'], code.icao_code)
-                        elif source['name'] == AVCODES_UK_BANNERS:
-                            request_made = True
-                            url = code.avcodes_uk_banner_download_url
-                            save_pic(url, logo_file_path, source['name'], code.icao_code)
-                
-                if request_made:
-                    time.sleep(args.delay)
+            fetched = [task for task in tasks if task.response is not None]
+            results = validate_responses([
+                (task.response.status_code, task.response.content, task.logo_file_path, task.source, task.code.icao_code)
+                for task in fetched
+            ])
+            for task, (data, outcome) in zip(fetched, results):
+                task.data, task.outcome = data, outcome
         finally:
-            print_progress()
+            for task in tasks:
+                emit(task)
 
-def execute_scraper():
-    # Initialize total counters
+    def write_task(task, emit):
+        try:
+            if task.data is not None:
+                task.outcome = store_logo(task.data, task.response.content, task.response.headers, task.logo_file_path,
+                                          task.source, task.code.icao_code)
+            finish_job(task.code.icao_code, task.source, task.outcome)
+        finally:
+            with counter_lock:
+                pending_jobs[task.code.icao_code] -= 1
+                done = pending_jobs[task.code.icao_code] == 0
+                if done:
+                    del pending_jobs[task.code.icao_code]
+            in_flight.release()
+            if done:
+                print_progress()
+
+def discover_codes(codes=None):
+    # Duplicates are dropped here, before anything is scheduled; the progress total grows as codes are found
+    global total_airlines, code_table
+    if codes is None:
+        codes = iter_airline_codes(max_age=0 if args.refresh_codes else CODES_CACHE_TTL, log=print_log)
+    code_table = CodeTable()
+    for iata, icao in codes:
+        row = code_table.add(iata, icao)
+        if row is not None:
+            total_airlines += 1
+            yield code_table[row]
+
+def execute_scraper(codes=None):
+    """Download every enabled source; codes are (IATA, ICAO) pairs to use instead of the scraped code list."""
+    logo_cache.miss_ttl = args.miss_ttl * 24 * 3600
+    # Every source folder is read once here, writes keep the indexes current after that
+    reset_dir_indexes()
     for source in sources:
-        dir_path = os.path.join(".", source['dir'])
-        if os.path.exists(dir_path):
-             count = len([name for name in os.listdir(dir_path) if os.path.isfile(os.path.join(dir_path, name))])
-             if source['name'] in total_counters:
-                 total_counters[source['name']] = count
+        counters.add(('total', source['name']), len(get_dir_index(source['dir'])))
+
+    global placeholder_index, journal, blob_store, validate_pool
+    # Set as they are opened, so the teardown only closes what this run opened
+    placeholder_index = journal = blob_store = validate_pool = None
+    dropped_placeholders.clear()
 
-    # Reserve space for the 3-line footer (Session + Total + Progress)
     print("-" * 120)
-    print('\n\n')
-
-    global airline_codes
-    # Your existing code for threading
-    airline_codes = sorted(get_airline_codes(), key=lambda x: x[1]) # Sort by ICAO code
-    
-    # Use ThreadPoolExecutor for efficient threading
-    with concurrent.futures.ThreadPoolExecutor(max_workers=args.threads) as executor:
-        futures = []
-        for airline in airline_codes:
-            iata = airline[0]
-            icao = airline[1]
-            code = AirlineCode(iata, icao)
-            futures.append(executor.submit(download_logo, code))
-        
-        # Wait for all futures to complete (handled by context manager exit, but explicitly ok)
-        concurrent.futures.wait(futures)
+    # From here on only the renderer thread writes to stdout
+    renderer.start()
+    try:
+        metrics.reset()
+        placeholder_index = PlaceholderIndex(cluster_size=args.placeholder_cluster, ttl=args.placeholder_ttl * 24 * 3600)
+        placeholder_index.load()
+        # Fingerprint known placeholders once instead of reopening them per download
+        for source in sources:
+            if source['enable'] and source['placeholder']:
+                placeholder_fingerprint(source['placeholder'])
+                with placeholder_image(source['placeholder']) as img:
+                    placeholder_index.add_placeholder(source['name'], dhash(img))
+
+        # Every host starts at its source's rate, or the one --threads/--delay used to give, and adapts from there
+        configure_limits(args.threads / args.delay if args.delay > 0 else args.threads * 10,
+                         {host_of(s): s['rate'] for s in sources if s['enable'] and s['rate']})
+        global dispatch
+        dispatch = compile_dispatch()
+
+        journal = Journal(resume=args.resume)
+        if args.cas:
+            blob_store = BlobStore()
+        if args.resume:
+            print_log(f"Resuming: {len(journal.done)} downloads already finished")
+
+        if args.validate_procs > 0:
+            # spawn, not fork: the FR24 index thread is already running
+            validate_pool = concurrent.futures.ProcessPoolExecutor(
+                max_workers=args.validate_procs, mp_context=multiprocessing.get_context('spawn'))
+
+        if args.engine == 'async':
+            from .async_engine import run_async
+            run_async(discover_codes(codes), host_limit=args.host_limit, validate_workers=max(args.threads, args.validate_procs))
+        else:
+            # Share one keep-alive pool per host across all workers
+            configure_pool(args.threads)
+
+            # Downloads start as soon as the first codes are discovered; the bounded
+            # queues between stages keep memory flat however long the code list is
+            global fetch_stage, in_flight
+            in_flight = threading.BoundedSemaphore(args.threads * 50)
+            pipeline = Pipeline(maxsize=args.threads * 4)
+            pipeline.add_stage("urls", generate_jobs)
+            fetch_stage = pipeline.add_stage("fetch", fetch_task, workers=args.threads)
+            pipeline.add_stage("validate", validate_tasks, workers=max(2, args.threads // 4, args.validate_procs),
+                               batch=VALIDATE_BATCH)
+            pipeline.add_stage("write", write_task)
+            pipeline.run(discover_codes(codes))
+            close_sessions()
+    finally:
+        # Also on Ctrl+C or an error, so the journal tail, cache rows and learned placeholders are kept for --resume
+        renderer.stop()
+        if validate_pool:
+            validate_pool.shutdown(cancel_futures=True)
+        if journal:
+            journal.close()
+        if placeholder_index:
+            placeholder_index.save()
+        if blob_store:
+            blob_store.close()
+        close_caches()
+    if args.report or args.prom:
+        write_metrics()
 
     for source in sources:
         if source['enable']:
-            # Count the number of files
-            dir = source['dir'] # Relative to root because we execute from root
-            if os.path.exists(dir):
-                file_count = len([name for name in os.listdir(dir) if os.path.isfile(os.path.join(dir, name))])
-                print(file_count, "from", source['name'])
\ No newline at end of file
+            # Count the number of files, as tracked since the start of the run
+            print(len(get_dir_index(source['dir'])), "from", source['name'])
+
+def write_metrics():
+    if args.report:
+        metrics.write_json(args.report, engine=args.engine, threads=args.threads, delay=args.delay,
+                           host_limit=args.host_limit, validate_procs=args.validate_procs,
+                           airlines=total_airlines, host_rates=limiter_rates())
+        print(f"Run report written to {args.report}")
+    if args.prom:
+        metrics.write_prometheus(args.prom)
+        print(f"Prometheus metrics written to {args.prom}")
@@ -1,20 +1,28 @@
+import json
+import os
+import time
+import concurrent.futures
+
 import requests
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
+
+from .config import HEADERS, HTML_PARSER, CACHE_DIR, CODES_CACHE_TTL
+
+CODES_CACHE_FILE = os.path.join(CACHE_DIR, "airline_codes.json")
 
-from .config import HEADERS
-def get_faa_codes():
+def get_faa_codes(log=print):
 
     url = "https://www.faa.gov/air_traffic/publications/atpubs/cnt_html/chap3_section_3.html"
     
     try:
         response = requests.get(url, headers=HEADERS, timeout=20)
         if response.status_code != 200:
-            print(f"Failed to fetch FAA codes: {response.status_code}")
+            log(f"Failed to fetch FAA codes: {response.status_code}")
             return set()
             
-        soup = BeautifulSoup(response.text, 'html.parser')
         # The FAA page usually has tables with class "col-collapse-table" or just generic tables
-        # Based on content inspection, we look for rows with 3Ltr code.
+        # Based on content inspection, we look for rows with 3Ltr code, so only table rows are parsed.
+        soup = BeautifulSoup(response.content, HTML_PARSER, parse_only=SoupStrainer('tr'))
         rows = soup.find_all('tr')
         faa_icaos = set()
         
@@ -28,60 +36,112 @@ def get_faa_codes():
                     
         return faa_icaos
     except Exception as e:
-        print(f"Error scraping FAA: {e}")
+        log(f"Error scraping FAA: {e}")
         return set()
 
-def get_airline_codes():
-    
+def load_cached_codes(max_age=CODES_CACHE_TTL):
+    """Return the cached {"codes": [...], "stats": {...}} if it is younger than max_age seconds, else None."""
+    try:
+        with open(CODES_CACHE_FILE, encoding="utf-8") as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if time.time() - cached.get("fetched", 0) > max_age:
+        return None
+    return cached
 
+def save_cached_codes(codes, stats):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    tmp_path = CODES_CACHE_FILE + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"fetched": time.time(), "codes": codes, "stats": stats}, f)
+    os.replace(tmp_path, CODES_CACHE_FILE)
 
-    # Source 1: Wikipedia
-    url = "https://en.wikipedia.org/wiki/List_of_airline_codes"
-    
-    response = requests.get(url, headers=HEADERS)
-    soup = BeautifulSoup(response.text, 'html.parser')
-    table = soup.find('table', {'class': 'wikitable sortable'})
-    
-    wiki_codes = []
-    wiki_icao_set = set() # Set for uniqueness within Wiki
-    
-    if table:
-        for row in table.findAll('tr'):
-            columns = row.findAll('td')
-            if columns:
-                iata_code = columns[0].get_text().strip()
-                icao_code = columns[1].get_text().strip()
-                if icao_code and len(icao_code) == 3 and icao_code not in wiki_icao_set:
-                    wiki_icao_set.add(icao_code)
-                    wiki_codes.append((iata_code, icao_code))
-
-    # Source 2: FAA
-    faa_icao_set = get_faa_codes()
+def print_source_stats(stats, log=print):
+    # One line per call, log may be a progress renderer that draws a footer under each line
+    for line in [
+        "",
+        "="*60,
+        f"{'Source Stats':^60}",
+        "="*60,
+        f"{'Wikipedia':<20} | {stats['wiki']:>10} codes",
+        f"{'FAA (Chap 3)':<20} | {stats['faa']:>10} codes",
+        "-" * 60,
+        f"{'Intersection':<20} | {stats['intersection']:>10}",
+        f"{'Unique to Wiki':<20} | {stats['unique_wiki']:>10}",
+        f"{'Unique to FAA':<20} | {stats['unique_faa']:>10}",
+        "-" * 60,
+        f"{'TOTAL COMBINED':<20} | {stats['total']:>10} airlines",
+        "="*60,
+        "",
+    ]:
+        log(line)
+
+def iter_airline_codes(max_age=CODES_CACHE_TTL, log=print):
+    """
+    Yield (IATA, ICAO) tuples as they are discovered: Wikipedia rows first, then FAA-only codes.
+    Lets the scraper start downloading before the FAA page has even been fetched.
+    A list cached less than max_age seconds ago is replayed instead of scraping (max_age=0 forces a refresh).
+    Messages go through log, the scraper passes its progress renderer's.
+    """
+    cached = load_cached_codes(max_age) if max_age > 0 else None
+    if cached:
+        for iata_code, icao_code in cached["codes"]:
+            yield (iata_code, icao_code)
+        print_source_stats(cached["stats"], log)
+        return
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+        # Source 2: FAA, fetched in the background while Wikipedia is parsed
+        faa_future = executor.submit(get_faa_codes, log)
+
+        # Source 1: Wikipedia
+        url = "https://en.wikipedia.org/wiki/List_of_airline_codes"
+        
+        response = requests.get(url, headers=HEADERS, timeout=30)
+        soup = BeautifulSoup(response.content, HTML_PARSER, parse_only=SoupStrainer('table'))
+        table = soup.find('table', {'class': 'wikitable sortable'})
+        
+        codes = []
+        wiki_icao_set = set() # Set for uniqueness within Wiki
+        
+        if table:
+            for row in table.find_all('tr'):
+                columns = row.find_all('td')
+                if columns:
+                    iata_code = columns[0].get_text().strip()
+                    icao_code = columns[1].get_text().strip()
+                    if icao_code and len(icao_code) == 3 and icao_code not in wiki_icao_set:
+                        wiki_icao_set.add(icao_code)
+                        codes.append((iata_code, icao_code))
+                        yield (iata_code, icao_code)
+
+        faa_icao_set = faa_future.result()
 
     # Stats Calculation
     intersection = wiki_icao_set.intersection(faa_icao_set)
     unique_wiki = wiki_icao_set - faa_icao_set
     unique_faa = faa_icao_set - wiki_icao_set
     
-    # Combined List
-    combined_codes = list(wiki_codes) # Start with Wiki (has IATA)
-    for icao in unique_faa:
-        combined_codes.append((None, icao)) # Add FAA-only (No IATA known here)
-    
-    total_combined = len(combined_codes)
+    # Combined List: Wiki (has IATA) then FAA-only (No IATA known here)
+    for icao in sorted(unique_faa):
+        codes.append((None, icao))
+        yield (None, icao)
+
+    stats = {
+        "wiki": len(wiki_icao_set),
+        "faa": len(faa_icao_set),
+        "intersection": len(intersection),
+        "unique_wiki": len(unique_wiki),
+        "unique_faa": len(unique_faa),
+        "total": len(codes),
+    }
+    # Only cache a complete list, a failed FAA fetch would otherwise stick for the whole TTL
+    if wiki_icao_set and faa_icao_set:
+        save_cached_codes(codes, stats)
 
     # Print Stats
-    print("\n" + "="*60)
-    print(f"{'Source Stats':^60}")
-    print("="*60)
-    print(f"{'Wikipedia':<20} | {len(wiki_icao_set):>10} codes")
-    print(f"{'FAA (Chap 3)':<20} | {len(faa_icao_set):>10} codes")
-    print("-" * 60)
-    print(f"{'Intersection':<20} | {len(intersection):>10}")
-    print(f"{'Unique to Wiki':<20} | {len(unique_wiki):>10}")
-    print(f"{'Unique to FAA':<20} | {len(unique_faa):>10}")
-    print("-" * 60)
-    print(f"{'TOTAL COMBINED':<20} | {total_combined:>10} airlines")
-    print("="*60 + "\n")
-
-    return combined_codes
+    print_source_stats(stats, log)
+
+def get_airline_codes(max_age=CODES_CACHE_TTL):
+    return list(iter_airline_codes(max_age))
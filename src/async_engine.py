@@ -0,0 +1,173 @@
+import asyncio
+import concurrent.futures
+import time
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from . import airline_logos as scraper
+from .config import HEADERS
+from .http_session import resolve_url
+from .metrics import metrics
+from .rate_limit import get_limiter
+
+MAX_RETRIES = 5
+
+
+async def fetch(session, host_limits, url, headers=None, source=None):
+    """
+    GET url under its host's concurrency cap and rate limiter, retrying 429/5xx and connection errors.
+    With a source, timings, status codes and retries are recorded in its metrics.
+    """
+    semaphore = host_limits[urlsplit(url).netloc]
+    limiter = get_limiter(url)
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            taken = False
+            while not taken:
+                # Without a token, ask again once the wait is up, at the rate of that moment
+                taken, wait = limiter.reserve()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+            async with semaphore:
+                sent = time.monotonic()
+                timings = {}
+                async with session.get(resolve_url(url), headers=headers, trace_request_ctx=timings) as response:
+                    content = await response.read()
+                    if source:
+                        _observe(source, timings, time.perf_counter())
+                        metrics.count(response.status, source)
+                    if (response.status == 429 or response.status >= 500) and attempt < MAX_RETRIES:
+                        retry_after = limiter.on_throttle(response.headers.get('Retry-After'), sent)
+                        # With Retry-After the limiter already holds the wait, otherwise back off 4s, 8s, 16s, 32s, 64s
+                        wait_time = 0 if retry_after is not None else 2 ** (attempt + 2)
+                    else:
+                        if response.status < 500 and response.status != 429:
+                            limiter.on_success()
+                        return response.status, content, response.headers
+            if source:
+                metrics.retry(source)
+            # Sleep outside the semaphore so other requests to the host can go
+            await asyncio.sleep(wait_time)
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            if attempt < MAX_RETRIES:
+                if source:
+                    metrics.retry(source)
+                await asyncio.sleep(1)
+                continue
+            raise
+
+
+def _mark(name):
+    async def callback(session, context, params):
+        timings = context.trace_request_ctx
+        if isinstance(timings, dict):
+            timings[name] = time.perf_counter()
+    return callback
+
+
+def _trace_config():
+    # Timestamps of each phase of a request, DNS and connect only happen for new connections
+    trace = aiohttp.TraceConfig()
+    trace.on_request_start.append(_mark('start'))
+    trace.on_dns_resolvehost_start.append(_mark('dns_start'))
+    trace.on_dns_resolvehost_end.append(_mark('dns_end'))
+    trace.on_connection_create_start.append(_mark('connect_start'))
+    trace.on_connection_create_end.append(_mark('connect_end'))
+    trace.on_request_end.append(_mark('headers'))
+    return trace
+
+
+def _observe(source, timings, finished):
+    if 'dns_start' in timings and 'dns_end' in timings:
+        metrics.observe('dns', source, timings['dns_end'] - timings['dns_start'])
+    if 'connect_start' in timings and 'connect_end' in timings:
+        metrics.observe('connect', source, timings['connect_end'] - timings['connect_start'])
+    if 'start' in timings and 'headers' in timings:
+        metrics.observe('ttfb', source, timings['headers'] - timings['start'])
+        metrics.observe('download', source, finished - timings['headers'])
+
+
+async def _download(session, host_limits, validate_pool, url, logo_file_path, source, icao_code):
+    loop = asyncio.get_running_loop()
+    try:
+        if url is scraper.FR24_PENDING:
+            await loop.run_in_executor(None, scraper.fr24_ready.wait)
+            url = scraper.fr24_map.get(icao_code)
+            if url is None:
+                return # Not in the FR24 index, nothing to download
+        request_headers = scraper.get_request_headers(logo_file_path, icao_code)
+        status, content, headers = await fetch(session, host_limits, url, request_headers, source)
+        if status == 429:
+            scraper.print_log(f"Rate limit exceeded (429) for {icao_code} from {source} after retries")
+            return
+        # Decoding and validating the image is CPU work, keep it off the event loop
+        await loop.run_in_executor(validate_pool, scraper.handle_response, status, content, headers, logo_file_path, source, icao_code)
+    except Exception as e:
+        scraper.print_log(f"Error downloading {icao_code} from {source}: {e}")
+        metrics.count('error', source)
+
+
+async def _worker(queue, session, host_limits, validate_pool):
+    while True:
+        code = await queue.get()
+        if code is None:
+            queue.task_done()
+            return
+        try:
+            jobs = scraper.get_download_jobs(code)
+            await asyncio.gather(*(
+                _download(session, host_limits, validate_pool, url, logo_file_path, source, code.icao_code)
+                for source, url, logo_file_path in jobs
+            ))
+        finally:
+            scraper.print_progress()
+            queue.task_done()
+
+
+async def _run(codes, host_limit, validate_workers):
+    # Every (ICAO, source) fetch runs as a coroutine; the per-host semaphores
+    # keep each CDN at host_limit in-flight requests.
+    host_limits = _HostLimits(host_limit)
+    connector = aiohttp.TCPConnector(limit=0, limit_per_host=host_limit)
+    timeout = aiohttp.ClientTimeout(total=10)
+    # Enough airlines in flight to keep every host saturated
+    num_workers = max(1, host_limit * 2)
+    queue = asyncio.Queue(maxsize=num_workers * 2)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=validate_workers) as validate_pool:
+        async with aiohttp.ClientSession(headers=HEADERS, connector=connector, timeout=timeout,
+                                         trace_configs=[_trace_config()]) as session:
+            workers = [
+                asyncio.create_task(_worker(queue, session, host_limits, validate_pool))
+                for _ in range(num_workers)
+            ]
+            # Discovery does blocking network I/O, pull codes from it in a thread (they come de-duplicated)
+            loop = asyncio.get_running_loop()
+            codes = iter(codes)
+            while True:
+                code = await loop.run_in_executor(None, next, codes, None)
+                if code is None:
+                    break
+                await queue.put(code)
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+
+
+class _HostLimits(dict):
+    """Lazily created asyncio.Semaphore per host."""
+
+    def __init__(self, limit):
+        super().__init__()
+        self.limit = limit
+
+    def __missing__(self, host):
+        semaphore = asyncio.Semaphore(self.limit)
+        self[host] = semaphore
+        return semaphore
+
+
+def run_async(codes, host_limit=20, validate_workers=4):
+    """Download every airline from the codes iterable on one event loop."""
+    asyncio.run(_run(codes, host_limit, validate_workers))
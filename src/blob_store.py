@@ -0,0 +1,131 @@
+import hashlib
+import os
+import sqlite3
+import sys
+import threading
+
+from .file_utils import write_atomic
+
+BLOB_DIR = ".blobs"
+COMMIT_EVERY = 100
+
+
+class BlobStore:
+    """
+    Content-addressed store for logos: every distinct image is kept once under .blobs/<hash[:2]>/<hash>.png
+    and each source's <ICAO>.png is a hardlink to it (a plain copy where hardlinks aren't possible).
+    index.sqlite maps (source, ICAO) -> hash so sources serving the same artwork can be looked up.
+    """
+
+    def __init__(self, root=BLOB_DIR):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.conn = sqlite3.connect(os.path.join(root, "index.sqlite"), check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries (source TEXT, icao TEXT, hash TEXT, PRIMARY KEY (source, icao))"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS entries_hash ON entries (hash)")
+        self.conn.commit()
+
+    def blob_path(self, digest):
+        return os.path.join(self.root, digest[:2], f"{digest}.png")
+
+    def store(self, data, logo_file_path, source, icao_code, digest=None):
+        """Write data for a source's ICAO through the store, returns the content hash."""
+        digest = digest or hashlib.sha256(data).hexdigest()
+        blob = self.blob_path(digest)
+        if not os.path.exists(blob):
+            os.makedirs(os.path.dirname(blob), exist_ok=True)
+            write_atomic(blob, data)
+        self._link(blob, logo_file_path, data)
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO entries (source, icao, hash) VALUES (?, ?, ?)", (source, icao_code, digest)
+            )
+            self.pending += 1
+            if self.pending >= COMMIT_EVERY:
+                self.conn.commit()
+                self.pending = 0
+        return digest
+
+    def remove(self, source, icao_code):
+        """Forget a source's ICAO, and its blob once no other entry uses it. The source's hardlink is left to the caller."""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT hash FROM entries WHERE source = ? AND icao = ?", (source, icao_code)
+            ).fetchone()
+            if row is None:
+                return
+            self.conn.execute("DELETE FROM entries WHERE source = ? AND icao = ?", (source, icao_code))
+            shared = self.conn.execute("SELECT 1 FROM entries WHERE hash = ? LIMIT 1", (row[0],)).fetchone()
+            self.pending += 1
+            if self.pending >= COMMIT_EVERY:
+                self.conn.commit()
+                self.pending = 0
+        if not shared:
+            try:
+                os.remove(self.blob_path(row[0]))
+            except FileNotFoundError:
+                pass
+
+    @staticmethod
+    def _link(blob, logo_file_path, data):
+        # Link under a temp name then rename over the old file, so the swap is atomic
+        tmp_path = f"{logo_file_path}.{threading.get_ident()}.link"
+        try:
+            os.link(blob, tmp_path)
+            os.replace(tmp_path, logo_file_path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            write_atomic(logo_file_path, data)
+
+    def sources_sharing(self, digest):
+        """All (source, ICAO) entries whose image has this hash."""
+        with self.lock:
+            return self.conn.execute(
+                "SELECT source, icao FROM entries WHERE hash = ? ORDER BY source, icao", (digest,)
+            ).fetchall()
+
+    def hash_of(self, source, icao_code):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT hash FROM entries WHERE source = ? AND icao = ?", (source, icao_code)
+            ).fetchone()
+        return row[0] if row else None
+
+    def duplicates(self):
+        """{hash: [(source, ICAO), ...]} for every image stored under more than one entry."""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT hash, source, icao FROM entries WHERE hash IN "
+                "(SELECT hash FROM entries GROUP BY hash HAVING COUNT(*) > 1) ORDER BY hash, source, icao"
+            ).fetchall()
+        groups = {}
+        for digest, source, icao in rows:
+            groups.setdefault(digest, []).append((source, icao))
+        return groups
+
+    def close(self):
+        with self.lock:
+            self.conn.commit()
+            self.conn.close()
+
+
+if __name__ == "__main__":
+    # python -m src.blob_store            -> list images shared by several entries
+    # python -m src.blob_store <file.png> -> list every source serving the same image as file.png
+    store = BlobStore()
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], "rb") as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+        for source, icao in store.sources_sharing(digest):
+            print(f"{source}: {icao}")
+    else:
+        groups = store.duplicates()
+        for digest, entries in groups.items():
+            print(f"{digest[:12]}  " + ", ".join(f"{source}/{icao}" for source, icao in entries))
+        print(f"{len(groups)} images shared by more than one source/ICAO")
+    store.close()
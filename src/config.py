@@ -4,3 +4,14 @@ USER_AGENT = "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36
 HEADERS = {
     "User-Agent": USER_AGENT
 }
+
+# BeautifulSoup backend: lxml's C parser is much faster, fall back to the pure Python one
+try:
+    import lxml  # noqa: F401
+    HTML_PARSER = "lxml"
+except ImportError:
+    HTML_PARSER = "html.parser"
+
+# On-disk cache for scraped indexes (airline code list, FR24 logo map)
+CACHE_DIR = ".cache"
+CODES_CACHE_TTL = 24 * 3600 # Seconds before the airline code list is scraped again
@@ -0,0 +1,59 @@
+import os
+import threading
+
+
+class DirIndex:
+    """
+    Names of the logo files (*.png, any case) in one folder. The folder is read once with os.scandir,
+    which gets entry types without a stat per file, and the index is kept current as files are
+    written or removed, so membership checks and counts never touch the filesystem again.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.names = set()
+        try:
+            with os.scandir(path) as it:
+                for entry in it:
+                    if entry.name.lower().endswith('.png') and entry.is_file():
+                        self.names.add(entry.name)
+        except FileNotFoundError:
+            pass
+
+    def __contains__(self, name):
+        return name in self.names
+
+    def __len__(self):
+        return len(self.names)
+
+    def add(self, name):
+        self.names.add(name)
+
+    def discard(self, name):
+        self.names.discard(name)
+
+    def stems(self):
+        """File names without their extension, i.e. the ICAO codes."""
+        return {os.path.splitext(name)[0] for name in self.names}
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_dir_index(directory):
+    """Return the shared DirIndex for a directory, reading it the first time it is asked for."""
+    index = _indexes.get(directory)
+    if index is None:
+        with _indexes_lock:
+            index = _indexes.get(directory)
+            if index is None:
+                index = DirIndex(directory)
+                _indexes[directory] = index
+    return index
+
+
+def reset_dir_indexes():
+    """Forget every index, the next get_dir_index reads its folder again."""
+    with _indexes_lock:
+        _indexes.clear()
@@ -0,0 +1,18 @@
+import os
+import tempfile
+
+
+def write_atomic(path, data):
+    """Write bytes to path via a temp file in the same directory and a rename, so readers never see a partial file."""
+    directory = os.path.dirname(path) or "."
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
@@ -1,60 +1,163 @@
+import json
+import os
+import time
+from html.parser import HTMLParser
+
 import requests
-from bs4 import BeautifulSoup
 
 URL = "https://www.flightradar24.com/data/airlines/"
-from .config import HEADERS
+from .config import HEADERS, CACHE_DIR
+from .http_session import resolve_url
 
-def get_fr24_map():
+FR24_CACHE_FILE = os.path.join(CACHE_DIR, "fr24_map.json")
+
+
+class _RowExtractor(HTMLParser):
     """
-    Scrapes FR24 airlines page and returns a dictionary: {ICAO: logo_url}
+    Streaming parser for the FR24 airlines table, no tree is built.
+    Completed rows land in self.rows as (ICAO, logo_url) for the caller to drain between feeds.
     """
-    print(f"Scraping {URL} for logo map...")
-    icao_map = {}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.rows = []
+        self.in_row = False
+        self.in_td = False
+        self.col = -1
+        self.code_text = []
+        self.img_url = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'tr':
+            self._end_row() # Tolerate a missing </tr>
+            self.in_row = True
+        elif tag == 'td' and self.in_row:
+            self.col += 1
+            self.in_td = True
+        elif tag == 'img' and self.in_td and self.col == 1 and self.img_url is None:
+            # Column 1 has the image
+            # <img ... data-bn-lazy-src="...">
+            self.img_url = dict(attrs).get('data-bn-lazy-src')
+
+    def handle_endtag(self, tag):
+        if tag == 'td':
+            self.in_td = False
+        elif tag in ('tr', 'table'):
+            self._end_row()
+
+    def handle_data(self, data):
+        # Column index 3 (0-based) usually has Codes: "2I / CSB" or "EMC"
+        if self.in_td and self.col == 3:
+            stripped = data.strip()
+            if stripped:
+                self.code_text.append(stripped)
+
+    def _end_row(self):
+        # A data row typically has ~6 columns
+        if self.in_row and self.col >= 3 and self.img_url:
+            icao = _parse_icao(''.join(self.code_text))
+            if icao:
+                self.rows.append((icao, self.img_url))
+        self.in_row = False
+        self.in_td = False
+        self.col = -1
+        self.code_text = []
+        self.img_url = None
+
+
+def _parse_icao(code_text):
+    # Logic to extract ICAO (3 chars). IATA is 2 chars.
+    # Common formats: "IATA / ICAO", "ICAO", "- / ICAO"
+    for p in code_text.split('/'):
+        p = p.strip()
+        if len(p) == 3:
+            return p
+    return None
+
+
+def _load_cache():
+    try:
+        with open(FR24_CACHE_FILE, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _save_cache(icao_map, response):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    tmp_path = FR24_CACHE_FILE + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({
+            "fetched": time.time(),
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "map": icao_map,
+        }, f)
+    os.replace(tmp_path, FR24_CACHE_FILE)
+
+
+def iter_fr24_map(log=print):
+    """
+    Yield (ICAO, logo_url) pairs from the FR24 airlines page as its rows are parsed.
+    The map is cached on disk and revalidated with a conditional GET; when the page hasn't changed
+    (or can't be fetched) the cached pairs are yielded instead. Messages go through log.
+    """
+    cached = _load_cache()
+    headers = dict(HEADERS)
+    if cached:
+        if cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+        if cached.get("last_modified"):
+            headers["If-Modified-Since"] = cached["last_modified"]
+
+    icao_map = {} # Pairs yielded from the live page so far
     try:
-        r = requests.get(URL, headers=HEADERS, timeout=30)
-        if r.status_code != 200:
-            print(f"Failed to fetch FR24 data: {r.status_code}")
-            return icao_map
-
-        soup = BeautifulSoup(r.text, 'html.parser')
-        tables = soup.find_all('table')
-        
-        # We assume the main table is the one with many rows. Inspect showed Table 0.
-        for table in tables:
-            rows = table.find_all('tr')
-            for row in rows:
-                cols = row.find_all('td')
-                # A data row typically has ~6 columns. The one we saw had class="w40..." etc.
-                if len(cols) < 4:
-                    continue
-                
-                # Column index 3 (0-based) usually has Codes: "2I / CSB" or "EMC"
-                # Let's inspect Col 3
-                code_text = cols[3].get_text(strip=True)
-                
-                # Logic to extract ICAO (3 chars). IATA is 2 chars.
-                # Common formats: "IATA / ICAO", "ICAO", "- / ICAO"
-                parts = [p.strip() for p in code_text.split('/')]
-                
-                icao = None
-                for p in parts:
-                    if len(p) == 3:
-                        icao = p
-                        break
-                
-                if not icao:
-                    continue
-                    
-                # Column 1 has the image
-                # <img ... data-bn-lazy-src="...">
-                img_tag = cols[1].find('img')
-                if img_tag and img_tag.get('data-bn-lazy-src'):
-                    url = img_tag.get('data-bn-lazy-src')
+        with requests.get(resolve_url(URL), headers=headers, timeout=30, stream=True) as r:
+            if r.status_code == 304 and cached:
+                log("FR24 index unchanged, using cached logo map.")
+                yield from cached["map"].items()
+                return
+            if r.status_code != 200:
+                log(f"Failed to fetch FR24 data: {r.status_code}")
+                if cached:
+                    yield from cached["map"].items()
+                return
+
+            parser = _RowExtractor()
+            r.encoding = r.encoding or "utf-8"
+            for chunk in r.iter_content(chunk_size=64 * 1024, decode_unicode=True):
+                parser.feed(chunk)
+                for icao, url in parser.rows:
                     icao_map[icao] = url
-                    
+                    yield icao, url
+                parser.rows.clear()
+            parser.close()
+            for icao, url in parser.rows:
+                icao_map[icao] = url
+                yield icao, url
+
+            if icao_map:
+                _save_cache(icao_map, r)
+            elif cached:
+                # A 200 without a single row: the layout changed or a challenge page was served
+                log("No airlines found in the FR24 index, using cached logo map.")
+                yield from cached["map"].items()
     except Exception as e:
-        print(f"Error scraping FR24: {e}")
-        
+        log(f"Error scraping FR24: {e}")
+        if cached:
+            # Fall back to the cached map, minus the rows the page already gave before it failed
+            log("Using cached logo map.")
+            for icao, url in cached["map"].items():
+                if icao not in icao_map:
+                    yield icao, url
+
+
+def get_fr24_map():
+    """
+    Scrapes FR24 airlines page and returns a dictionary: {ICAO: logo_url}
+    """
+    print(f"Scraping {URL} for logo map...")
+    icao_map = dict(iter_fr24_map())
     print(f"Found {len(icao_map)} airlines with logos from FR24 index.")
     return icao_map
 
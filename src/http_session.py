@@ -0,0 +1,72 @@
+import threading
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .config import HEADERS
+
+# One keep-alive session per source host, shared by every worker thread.
+# The adapter's urllib3 pool is thread safe; pool_block makes extra threads
+# wait for a free connection instead of opening throwaway ones.
+_sessions = {}
+_sessions_lock = threading.Lock()
+_pool_size = 10
+_redirect = None # Base URL every request is sent to instead, see redirect_hosts
+
+
+def configure_pool(threads):
+    """Size the per-host connection pools for the given number of worker threads."""
+    global _pool_size
+    with _sessions_lock:
+        _pool_size = max(1, threads)
+        # Drop sessions built with the old size, they get rebuilt on demand
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+
+
+def _new_session():
+    session = requests.Session()
+    session.headers.update(HEADERS)
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=_pool_size, pool_block=True)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_session(url):
+    """Return the shared session for the host of url."""
+    host = urlsplit(url).netloc
+    session = _sessions.get(host)
+    if session is None:
+        with _sessions_lock:
+            session = _sessions.get(host)
+            if session is None:
+                session = _new_session()
+                _sessions[host] = session
+    return session
+
+
+def close_sessions():
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+
+
+def redirect_hosts(base_url):
+    """
+    Send every request to base_url + "/<host>/<path>" instead of the real host, e.g. a local mock CDN.
+    Sessions, rate limits and metrics stay keyed by the real host. None switches it off.
+    """
+    global _redirect
+    _redirect = base_url.rstrip("/") if base_url else None
+
+
+def resolve_url(url):
+    """The URL to actually request for url."""
+    if _redirect is None:
+        return url
+    parts = urlsplit(url)
+    return f"{_redirect}/{parts.netloc}{parts.path}" + (f"?{parts.query}" if parts.query else "")
@@ -0,0 +1,158 @@
+import hashlib
+import os
+import time
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+from .phash import dhash_batch
+
+RB_PLACEHOLDER_PATH = os.path.join(os.path.dirname(__file__), 'RB_PLACERHOLDER.png')
+
+THUMB_SIZE = 32
+NEAR_UNIFORM_STD = 1.5 # Largest per-channel std dev (0-255, alpha included) of the thumbnail that still reads as one flat colour
+
+_placeholder_fingerprints = {} # path -> (size, pixel digest)
+
+
+def pixel_digest(img):
+    """
+    Canonical digest of what an image looks like: size plus its pixels as raw RGBA bytes.
+    Equal digests mean visually identical images, whatever the file encoding or palette mode.
+    """
+    if img.mode != 'RGBA':
+        img = img.convert('RGBA')
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"RGBA:{img.size[0]}x{img.size[1]}:".encode())
+    digest.update(img.tobytes())
+    return digest.hexdigest()
+
+
+def file_pixel_digest(file_path):
+    """pixel_digest of an image file, None if it can't be decoded."""
+    try:
+        with Image.open(file_path) as img:
+            return pixel_digest(img)
+    except Exception:
+        return None
+
+
+def placeholder_fingerprint(path=RB_PLACEHOLDER_PATH):
+    # Loaded once, placeholder files never change during a run
+    fingerprint = _placeholder_fingerprints.get(path)
+    if fingerprint is None:
+        with placeholder_image(path) as img:
+            fingerprint = _placeholder_fingerprints[path] = img.size, pixel_digest(img)
+    return fingerprint
+
+
+def placeholder_image(path=RB_PLACEHOLDER_PATH):
+    """Open a placeholder file (the RadarBox one by default), for callers that need more than its fingerprint."""
+    return Image.open(path)
+
+
+def is_placeholder(img, path=RB_PLACEHOLDER_PATH):
+    size, digest = placeholder_fingerprint(path)
+    # Size rules out almost everything without hashing any pixels
+    if img.size != size:
+        return False
+    return pixel_digest(img) == digest
+
+
+def validate_batch(images, check_placeholder=None):
+    """
+    Validate a batch of decoded images with array operations; NumPy releases the GIL inside them,
+    so validate workers don't stall the fetch threads.
+    check_placeholder gives per image the placeholder file to compare it with (True for the RadarBox one) or None.
+    Returns (reasons, hashes): per image the reason it should be rejected ('1x1', 'blank', 'transparent',
+    'near-uniform', 'placeholder') or None, and every image's dhash as a uint64 array.
+    """
+    count = len(images)
+    reasons = [None] * count
+    if not count:
+        return reasons, np.zeros(0, dtype=np.uint64)
+    if check_placeholder is None:
+        check_placeholder = [False] * count
+
+    hashes = dhash_batch(images)
+    # The spread is measured over premultiplied RGBA, not the image flattened onto white: white or light
+    # artwork on a transparent background only stands out in its alpha channel
+    thumbs = np.stack([
+        np.asarray(img.convert('RGBA').resize((THUMB_SIZE, THUMB_SIZE), Image.BOX), dtype=np.float32)
+        for img in images
+    ])
+    thumbs[..., :3] *= thumbs[..., 3:] / 255
+    spread = thumbs.reshape(count, -1, 4).std(axis=1).max(axis=1)
+    sizes = np.array([img.size for img in images])
+    single_pixel = (sizes == 1).all(axis=1)
+
+    for i, img in enumerate(images):
+        if single_pixel[i]:
+            reasons[i] = '1x1'
+            continue
+        has_alpha = img.mode in ('RGBA', 'LA', 'PA') or 'transparency' in img.info
+        pixels = np.asarray(img.convert('RGBA') if has_alpha and img.mode != 'RGBA' else img)
+        # Every pixel equals the first one, alpha included
+        rows = pixels.reshape(-1, pixels.shape[-1] if pixels.ndim == 3 else 1)
+        if (rows == rows[0]).all():
+            reasons[i] = 'blank'
+        elif has_alpha and pixels[..., -1].max() == 0:
+            reasons[i] = 'transparent' # Colour data under a fully transparent alpha channel
+        elif spread[i] < NEAR_UNIFORM_STD:
+            reasons[i] = 'near-uniform' # Flat colour with a little noise (JPEG artefacts, dithering)
+        elif check_placeholder[i] and is_placeholder(
+                img, RB_PLACEHOLDER_PATH if check_placeholder[i] is True else check_placeholder[i]):
+            reasons[i] = 'placeholder'
+    return reasons, hashes
+
+
+def analyse_images(contents, check_placeholder, reencode=False):
+    """
+    Decode and validate a batch of downloaded files. This is the CPU-bound part of validation and
+    touches no shared state, so it can run in a worker process.
+    Returns (error, reason, hash, png, timings) per file: error is why it couldn't be decoded (else None),
+    png the bytes to save instead of the original when it had to be re-encoded (else None), timings the
+    seconds spent decoding it and its share of the batch validation.
+    """
+    results = [None] * len(contents)
+    decoded = [] # (index, image, decode seconds)
+    for i, content in enumerate(contents):
+        started = time.perf_counter()
+        try:
+            img = Image.open(BytesIO(content))
+            img.load()
+            decoded.append((i, img, time.perf_counter() - started))
+        except Exception as e:
+            results[i] = str(e), None, None, None, (time.perf_counter() - started, 0.0)
+    if not decoded:
+        return results
+
+    started = time.perf_counter()
+    try:
+        reasons, hashes = validate_batch([img for _, img, _ in decoded], [check_placeholder[i] for i, _, _ in decoded])
+    except Exception as e:
+        if len(decoded) == 1:
+            i, _, decode_time = decoded[0]
+            results[i] = str(e), None, None, None, (decode_time, time.perf_counter() - started)
+            return results
+        # One odd image shouldn't fail the whole batch, check them one by one instead
+        for i, _, _ in decoded:
+            results[i] = analyse_images([contents[i]], [check_placeholder[i]], reencode)[0]
+        return results
+    validate_time = (time.perf_counter() - started) / len(decoded)
+
+    for k, (i, img, decode_time) in enumerate(decoded):
+        timings = decode_time, validate_time
+        png = None
+        # Keep the original bytes unless asked to re-encode, or they aren't a PNG (files are named .png)
+        if not reasons[k] and (reencode or img.format != 'PNG'):
+            try:
+                buffer = BytesIO()
+                img.save(buffer, format='PNG')
+                png = buffer.getvalue()
+            except Exception as e:
+                results[i] = str(e), None, None, None, timings
+                continue
+        results[i] = None, reasons[k], int(hashes[k]), png, timings
+    return results
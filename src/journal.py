@@ -0,0 +1,50 @@
+import os
+import threading
+
+JOURNAL_FILE = ".scrape_journal.tsv"
+FSYNC_EVERY = 200
+
+
+class Journal:
+    """
+    Append-only log of finished (ICAO, source, outcome) entries, one tab separated line each.
+    Lines are fsynced in batches; a torn last line after a crash is simply ignored on reload.
+    """
+
+    def __init__(self, path=JOURNAL_FILE, resume=False):
+        self.path = path
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.done = set()
+        if resume and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    parts = line.rstrip("\n").split("\t")
+                    if len(parts) == 3 and line.endswith("\n"):
+                        self.done.add((parts[0], parts[1]))
+        # A fresh run starts a fresh journal
+        self.file = open(path, "a" if resume else "w", encoding="utf-8")
+
+    def is_done(self, icao_code, source):
+        return (icao_code, source) in self.done
+
+    def record(self, icao_code, source, outcome):
+        with self.lock:
+            if self.file.closed:
+                return # Closed by the teardown of an interrupted run, a worker is still finishing up
+            self.file.write(f"{icao_code}\t{source}\t{outcome}\n")
+            self.pending += 1
+            if self.pending >= FSYNC_EVERY:
+                self._sync()
+
+    def _sync(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.pending = 0
+
+    def close(self):
+        with self.lock:
+            if self.file.closed:
+                return
+            self._sync()
+            self.file.close()
@@ -0,0 +1,114 @@
+import os
+import sqlite3
+import threading
+import time
+
+CACHE_FILE = ".cache.sqlite"
+COMMIT_EVERY = 100
+
+# Seconds a recorded miss (404/403, blank, 1x1, placeholder) is trusted before refetching.
+# Set from --miss-ttl, 0 disables the negative cache.
+miss_ttl = 7 * 24 * 3600
+
+
+class SourceCache:
+    """
+    Per-source metadata store kept next to the logos (e.g. flightaware_logos/.cache.sqlite).
+    Records the validators of the last saved download so reruns can revalidate with a conditional GET,
+    and the misses (not found, blank, placeholder) so reruns don't ask for them again until they expire.
+    """
+
+    def __init__(self, source_dir):
+        self.path = os.path.join(source_dir, CACHE_FILE)
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS logos ("
+            "icao TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, length INTEGER, sha256 TEXT)"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS misses (icao TEXT PRIMARY KEY, reason TEXT, ts REAL)"
+        )
+        self.conn.commit()
+        # Unexpired misses are held in memory so lookups don't touch sqlite
+        cutoff = time.time() - miss_ttl
+        self.misses = {
+            row[0] for row in self.conn.execute("SELECT icao FROM misses WHERE ts >= ?", (cutoff,))
+        } if miss_ttl > 0 else set()
+
+    def get(self, icao_code):
+        with self.lock:
+            return self.conn.execute(
+                "SELECT etag, last_modified, length, sha256 FROM logos WHERE icao = ?", (icao_code,)
+            ).fetchone()
+
+    def conditional_headers(self, icao_code):
+        row = self.get(icao_code)
+        headers = {}
+        if row:
+            etag, last_modified = row[0], row[1]
+            if etag:
+                headers["If-None-Match"] = etag
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
+        return headers
+
+    def record(self, icao_code, etag, last_modified, length, sha256):
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO logos (icao, etag, last_modified, length, sha256) VALUES (?, ?, ?, ?, ?)",
+                (icao_code, etag, last_modified, length, sha256),
+            )
+            self._bump()
+
+    def is_known_miss(self, icao_code):
+        return icao_code in self.misses
+
+    def record_miss(self, icao_code, reason):
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO misses (icao, reason, ts) VALUES (?, ?, ?)",
+                (icao_code, reason, time.time()),
+            )
+            self._bump()
+
+    def clear_miss(self, icao_code):
+        with self.lock:
+            self.misses.discard(icao_code)
+            self.conn.execute("DELETE FROM misses WHERE icao = ?", (icao_code,))
+            self._bump()
+
+    def _bump(self):
+        self.pending += 1
+        if self.pending >= COMMIT_EVERY:
+            self.conn.commit()
+            self.pending = 0
+
+    def close(self):
+        with self.lock:
+            self.conn.commit()
+            self.conn.close()
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(source_dir):
+    """Return the shared SourceCache for a source directory."""
+    cache = _caches.get(source_dir)
+    if cache is None:
+        with _caches_lock:
+            cache = _caches.get(source_dir)
+            if cache is None:
+                cache = SourceCache(source_dir)
+                _caches[source_dir] = cache
+    return cache
+
+
+def close_caches():
+    with _caches_lock:
+        for cache in _caches.values():
+            cache.close()
+        _caches.clear()
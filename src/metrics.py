@@ -0,0 +1,129 @@
+import json
+import time
+from bisect import bisect_left
+
+from .file_utils import write_atomic
+from .progress import Counters
+
+# Upper bounds (seconds) of the latency histogram buckets, the last bucket is +Inf
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+STAGES = ('dns', 'connect', 'ttfb', 'download', 'decode', 'validate', 'write')
+
+
+class Metrics:
+    """
+    Per-source latency histograms for every stage of a download, outcome counters and retry counts.
+    Recording goes through Counters, so the hot path takes no lock.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.counts = Counters()
+        self.started = time.time()
+
+    def observe(self, stage, source, seconds):
+        self.counts.add(('bucket', stage, source, bisect_left(BUCKETS, seconds)))
+        self.counts.add(('sum', stage, source), seconds)
+
+    def count(self, outcome, source):
+        """outcome is a status code ('200', '404', '429'...), a reject reason ('blank', 'placeholder'...), 'saved' or 'error'."""
+        self.counts.add(('outcome', str(outcome), source))
+
+    def retry(self, source):
+        self.counts.add(('retries', source))
+
+    def _histograms(self, snapshot):
+        # {(stage, source): [count per bucket]}, the +Inf bucket last
+        histograms = {}
+        for key, value in snapshot.items():
+            if key[0] == 'bucket':
+                _, stage, source, index = key
+                histograms.setdefault((stage, source), [0] * (len(BUCKETS) + 1))[index] += value
+        return histograms
+
+    def summary(self, stage):
+        """count, p50 and p99 of a stage over all sources together."""
+        merged = [0] * (len(BUCKETS) + 1)
+        for (name, _), buckets in self._histograms(self.counts.snapshot()).items():
+            if name == stage:
+                merged = [a + b for a, b in zip(merged, buckets)]
+        return {'count': sum(merged), 'p50': _quantile(merged, 0.5), 'p99': _quantile(merged, 0.99)}
+
+    def report(self, **info):
+        """The run as a JSON-able dict; info (engine, threads...) is included as is."""
+        snapshot = self.counts.snapshot()
+        sources = {}
+        for (stage, source), buckets in sorted(self._histograms(snapshot).items(), key=lambda item: (item[0][1], STAGES.index(item[0][0]))):
+            total = sum(buckets)
+            sources.setdefault(source, {}).setdefault('latency', {})[stage] = {
+                'count': total,
+                'mean': snapshot.get(('sum', stage, source), 0) / total if total else None,
+                'p50': _quantile(buckets, 0.5),
+                'p90': _quantile(buckets, 0.9),
+                'p99': _quantile(buckets, 0.99),
+                'buckets': dict(zip([str(b) for b in BUCKETS] + ['+Inf'], buckets)),
+            }
+        for key, value in snapshot.items():
+            if key[0] == 'outcome':
+                sources.setdefault(key[2], {}).setdefault('outcomes', {})[key[1]] = value
+            elif key[0] == 'retries':
+                sources.setdefault(key[1], {})['retries'] = value
+        return dict(info, started=self.started, duration=time.time() - self.started, sources=sources)
+
+    def write_json(self, path, **info):
+        write_atomic(path, json.dumps(self.report(**info), indent=2, sort_keys=True).encode())
+
+    def write_prometheus(self, path):
+        """Prometheus text exposition format, written atomically for the node exporter's textfile collector."""
+        snapshot = self.counts.snapshot()
+        lines = [
+            "# HELP airline_logos_stage_seconds Time spent per download stage.",
+            "# TYPE airline_logos_stage_seconds histogram",
+        ]
+        for (stage, source), buckets in sorted(self._histograms(snapshot).items()):
+            labels = f'stage="{stage}",source="{_escape(source)}"'
+            cumulative = 0
+            for bound, value in zip([str(b) for b in BUCKETS] + ['+Inf'], buckets):
+                cumulative += value
+                lines.append(f'airline_logos_stage_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'airline_logos_stage_seconds_sum{{{labels}}} {snapshot.get(("sum", stage, source), 0)}')
+            lines.append(f'airline_logos_stage_seconds_count{{{labels}}} {cumulative}')
+        lines += [
+            "# HELP airline_logos_outcomes_total Responses and results by outcome.",
+            "# TYPE airline_logos_outcomes_total counter",
+        ]
+        for key, value in sorted((k, v) for k, v in snapshot.items() if k[0] == 'outcome'):
+            lines.append(f'airline_logos_outcomes_total{{outcome="{key[1]}",source="{_escape(key[2])}"}} {value}')
+        lines += [
+            "# HELP airline_logos_retries_total Requests retried after an error, 429 or 5xx.",
+            "# TYPE airline_logos_retries_total counter",
+        ]
+        for key, value in sorted((k, v) for k, v in snapshot.items() if k[0] == 'retries'):
+            lines.append(f'airline_logos_retries_total{{source="{_escape(key[1])}"}} {value}')
+        write_atomic(path, ("\n".join(lines) + "\n").encode())
+
+
+def _quantile(buckets, q):
+    # Linear interpolation inside the bucket holding the q-th observation, like Prometheus' histogram_quantile
+    total = sum(buckets)
+    if not total:
+        return None
+    rank = q * total
+    seen = 0
+    for index, value in enumerate(buckets):
+        if value and seen + value >= rank:
+            if index == len(BUCKETS):
+                return BUCKETS[-1] # Beyond the last bound, report the bound
+            lower = BUCKETS[index - 1] if index else 0.0
+            return lower + (BUCKETS[index] - lower) * (rank - seen) / value
+        seen += value
+    return BUCKETS[-1]
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"')
+
+
+metrics = Metrics()
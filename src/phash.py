@@ -0,0 +1,180 @@
+import json
+import os
+import threading
+import time
+
+import numpy as np
+from PIL import Image
+
+from .config import CACHE_DIR
+
+PLACEHOLDERS_FILE = os.path.join(CACHE_DIR, "placeholders.json")
+HASH_SIZE = 8 # 8x8 gradient bits -> 64 bit hash
+
+
+def flatten(img):
+    """
+    The image as RGB on a mid grey background, so transparent areas hash like empty space.
+    Grey rather than white, or white artwork on a transparent logo would vanish from its hash.
+    """
+    if img.mode in ('RGBA', 'LA', 'P', 'PA'):
+        img = img.convert('RGBA')
+        background = Image.new('RGBA', img.size, (128, 128, 128, 255))
+        img = Image.alpha_composite(background, img)
+    return img.convert('RGB')
+
+
+def dhash_batch(images):
+    """
+    64 bit difference hashes for a batch of images, as a uint64 array.
+    Each image is flattened onto grey and shrunk to 9x8 greyscale; each bit says whether a pixel
+    is brighter than its left neighbour. Re-encodes, rescales and small edits of the same artwork
+    land within a few bits of each other.
+    """
+    if not images:
+        return np.zeros(0, dtype=np.uint64)
+    pixels = np.stack([
+        np.asarray(flatten(img).convert('L').resize((HASH_SIZE + 1, HASH_SIZE), Image.BILINEAR), dtype=np.int16)
+        for img in images
+    ])
+    bits = pixels[:, :, 1:] > pixels[:, :, :-1]
+    packed = np.packbits(bits.reshape(len(images), -1), axis=1)
+    return packed.view('>u8').reshape(-1).astype(np.uint64)
+
+
+def dhash(img):
+    return int(dhash_batch([img])[0])
+
+
+def hamming(a, b):
+    return bin(a ^ b).count('1')
+
+
+def hamming_matrix(a, b):
+    """Pairwise Hamming distances between two uint64 hash arrays, shape (len(a), len(b))."""
+    xor = np.bitwise_xor(np.asarray(a, dtype=np.uint64)[:, None], np.asarray(b, dtype=np.uint64)[None, :])
+    return np.unpackbits(xor.view(np.uint8).reshape(xor.shape + (8,)), axis=-1).sum(axis=-1)
+
+
+class BKTree:
+    """Burkhard-Keller tree over Hamming distance: near matches are found without scanning every hash."""
+
+    def __init__(self):
+        self.root = None # [hash, values, {distance: child}]
+
+    def add(self, hash_value, value):
+        if self.root is None:
+            self.root = [hash_value, [value], {}]
+            return
+        node = self.root
+        while True:
+            distance = hamming(hash_value, node[0])
+            if distance == 0:
+                node[1].append(value)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [hash_value, [value], {}]
+                return
+            node = child
+
+    def search(self, hash_value, max_distance):
+        """All (distance, hash, values) within max_distance of hash_value."""
+        found = []
+        stack = [self.root] if self.root else []
+        while stack:
+            node = stack.pop()
+            distance = hamming(hash_value, node[0])
+            if distance <= max_distance:
+                found.append((distance, node[0], node[1]))
+            # Triangle inequality: only children in [d - max, d + max] can hold matches
+            for child_distance, child in node[2].items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    stack.append(child)
+        return found
+
+
+class PlaceholderIndex:
+    """
+    Per-source index of the perceptual hashes seen during a run.
+    An image is a placeholder if it is near a known placeholder hash, or if near-identical images
+    have now been served for cluster_size different ICAOs by the same source (a generic "no logo" image).
+    Learned placeholder hashes are persisted so later runs reject them on sight, until they are
+    older than ttl seconds; a false positive cluster then gets another chance. Seeded placeholders
+    (the files in the source registry) are added every run and never saved.
+    """
+
+    def __init__(self, max_distance=4, cluster_size=25, ttl=30 * 24 * 3600):
+        self.max_distance = max_distance
+        self.cluster_size = cluster_size
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.trees = {}
+        self.placeholders = {} # source -> set of hashes, seeded and learned
+        self.learned = {} # source -> {hash: {"learned": timestamp, "icaos": [...]}}
+
+    def add_placeholder(self, source, hash_value):
+        self.placeholders.setdefault(source, set()).add(hash_value)
+
+    def add_learned(self, source, hash_value, learned, icaos=()):
+        self.add_placeholder(source, hash_value)
+        self.learned.setdefault(source, {})[hash_value] = {"learned": learned, "icaos": list(icaos)}
+
+    def known_mask(self, source, hashes):
+        """Which of a uint64 array of hashes are within max_distance of a known placeholder of the source."""
+        with self.lock:
+            known = np.array(sorted(self.placeholders.get(source, ())), dtype=np.uint64)
+        if not len(known) or not len(hashes):
+            return np.zeros(len(hashes), dtype=bool)
+        return (hamming_matrix(hashes, known) <= self.max_distance).any(axis=1)
+
+    def learn(self, source, hash_value, value):
+        """
+        Record an ingested image whose hash doesn't match a known placeholder (see known_mask).
+        Returns (is_placeholder, earlier values of a cluster that was just flagged); the earlier
+        values were accepted before the cluster was recognised.
+        """
+        with self.lock:
+            return self._learn(source, hash_value, value)
+
+    def _learn(self, source, hash_value, value):
+        tree = self.trees.setdefault(source, BKTree())
+        tree.add(hash_value, value)
+        if not self.cluster_size:
+            return False, []
+        matches = tree.search(hash_value, self.max_distance)
+        members = [member for _, _, values in matches for member in values]
+        if len(members) < self.cluster_size:
+            return False, []
+        # A few of the ICAOs it was served for, to check a cluster by hand
+        self.add_learned(source, hash_value, time.time(), sorted({member[0] for member in members})[:5])
+        return True, [member for member in members if member != value]
+
+    def load(self, path=PLACEHOLDERS_FILE):
+        """Load the learned placeholders that haven't expired; a ttl of 0 ignores them all."""
+        if self.ttl <= 0:
+            return
+        try:
+            with open(path, encoding="utf-8") as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return
+        cutoff = time.time() - self.ttl
+        for source, hashes in saved.items():
+            # Older files held a plain list of hashes with no learned time, those are dropped
+            if not isinstance(hashes, dict):
+                continue
+            for hash_value, entry in hashes.items():
+                if entry.get("learned", 0) >= cutoff:
+                    self.add_learned(source, int(hash_value, 16), entry["learned"], entry.get("icaos", ()))
+
+    def save(self, path=PLACEHOLDERS_FILE):
+        """Save the learned placeholders, with when they were learned and a few ICAOs they were served for."""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self.lock:
+            saved = {
+                source: {f"{h:016x}": entry for h, entry in sorted(learned.items())}
+                for source, learned in self.learned.items() if learned
+            }
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(saved, f, indent=1)
@@ -0,0 +1,147 @@
+import heapq
+import itertools
+import queue
+import threading
+import time
+import traceback
+
+_DONE = object()
+
+
+class Stage:
+    """
+    A named step of a Pipeline: workers threads calling fn(item, emit) on its input queue.
+    With batch > 1, fn gets a list of up to batch items instead, whatever is queued when a worker wakes up.
+    """
+
+    def __init__(self, pipeline, name, fn, workers, batch=1):
+        self.pipeline = pipeline
+        self.name = name
+        self.fn = fn
+        self.workers = workers
+        self.batch = batch
+        self.queue = None
+        self.deferred = 0 # Items waiting in the scheduler to come back to this stage
+
+    def defer(self, item, delay):
+        """Hand item back to this stage after delay seconds without holding a worker meanwhile."""
+        self.pipeline._schedule(self, item, delay)
+
+
+class Pipeline:
+    """
+    Stages joined by bounded queues. Each stage's workers take items from the stage's input queue
+    and pass results on with emit(); when the next queue is full, emit blocks, so a slow stage
+    throttles everything upstream of it and memory stays flat no matter how many items flow through.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.stages = []
+        self._heap = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._stopping = False
+
+    def add_stage(self, name, fn, workers=1, batch=1):
+        """fn(item, emit) is called for every item; it may emit zero or more items to the next stage."""
+        stage = Stage(self, name, fn, workers, batch)
+        self.stages.append(stage)
+        return stage
+
+    def run(self, items):
+        """Feed items into the first stage and block until every stage has drained."""
+        for stage in self.stages:
+            stage.queue = queue.Queue(maxsize=self.maxsize)
+        scheduler = threading.Thread(target=self._run_scheduler, name="scheduler", daemon=True)
+        scheduler.start()
+
+        groups = []
+        for i, stage in enumerate(self.stages):
+            emit = self.stages[i + 1].queue.put if i + 1 < len(self.stages) else _discard
+            threads = [
+                threading.Thread(target=self._work, args=(stage, emit), name=f"{stage.name}-{n}", daemon=True)
+                for n in range(stage.workers)
+            ]
+            for thread in threads:
+                thread.start()
+            groups.append(threads)
+
+        for item in items:
+            self.stages[0].queue.put(item)
+        self.stages[0].queue.put(_DONE)
+
+        # Shut stages down in order, each one only after everything upstream has finished
+        for i, threads in enumerate(groups):
+            for thread in threads:
+                thread.join()
+            if i + 1 < len(self.stages):
+                self.stages[i + 1].queue.put(_DONE)
+
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        scheduler.join()
+
+    def _work(self, stage, emit):
+        while True:
+            item = stage.queue.get()
+            if item is _DONE:
+                # Let the other workers of this stage see it too
+                stage.queue.put(_DONE)
+                with self._cond:
+                    deferred = stage.deferred
+                if not deferred:
+                    return
+                # Deferred items will come back to this queue, keep serving it
+                time.sleep(0.05)
+                continue
+            if stage.batch > 1:
+                item = self._take_batch(stage, item)
+            try:
+                stage.fn(item, emit)
+            except Exception:
+                traceback.print_exc()
+
+    def _take_batch(self, stage, first):
+        # Never waits for a batch to fill up, a quiet stage handles items as they come
+        items = [first]
+        while len(items) < stage.batch:
+            try:
+                item = stage.queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _DONE:
+                stage.queue.put(_DONE)
+                break
+            items.append(item)
+        return items
+
+    def _schedule(self, stage, item, delay):
+        with self._cond:
+            stage.deferred += 1
+            heapq.heappush(self._heap, (time.monotonic() + delay, next(self._seq), stage, item))
+            self._cond.notify()
+
+    def _run_scheduler(self):
+        while True:
+            with self._cond:
+                while True:
+                    if self._stopping:
+                        return
+                    if self._heap:
+                        due, _, stage, item = self._heap[0]
+                        wait = due - time.monotonic()
+                        if wait <= 0:
+                            heapq.heappop(self._heap)
+                            break
+                        self._cond.wait(wait)
+                    else:
+                        self._cond.wait()
+            stage.queue.put(item)
+            with self._cond:
+                stage.deferred -= 1
+
+
+def _discard(item):
+    pass
@@ -0,0 +1,122 @@
+import queue
+import shutil
+import sys
+import threading
+import time
+
+
+class Counters:
+    """
+    Counters that worker threads bump without taking a lock: every thread adds to a dict of its own
+    and readers sum them up. Only the owning thread ever writes a dict, so no update is lost.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._cells = []
+        self._lock = threading.Lock() # Only taken the first time a thread counts something
+
+    def add(self, key, amount=1):
+        cell = getattr(self._local, 'cell', None)
+        if cell is None:
+            cell = self._local.cell = {}
+            with self._lock:
+                self._cells.append(cell)
+        cell[key] = cell.get(key, 0) + amount
+
+    def snapshot(self):
+        """Totals of every key counted so far."""
+        with self._lock:
+            cells = list(self._cells)
+        totals = {}
+        for cell in cells:
+            # dict() copies in one step, the owner may be adding a key meanwhile
+            for key, value in dict(cell).items():
+                totals[key] = totals.get(key, 0) + value
+        return totals
+
+
+class ProgressRenderer:
+    """
+    The only thread writing to stdout while it runs. Workers queue their log lines; on a terminal
+    they are printed above a footer that is redrawn at most `rate` times a second. Without a terminal
+    (logs, CI) the lines are printed as they come and the footer every `summary_interval` seconds.
+    footer(columns) returns the footer lines for the current terminal width.
+    """
+
+    def __init__(self, footer, rate=10, summary_interval=30, stream=None):
+        self.footer = footer
+        self.interval = 1 / rate
+        self.summary_interval = summary_interval
+        self.stream = stream or sys.stdout
+        self.tty = self.stream.isatty()
+        self.messages = queue.SimpleQueue()
+        self.thread = None
+        self._stop = threading.Event()
+        self._drawn = [] # Footer lines currently on screen
+
+    def log(self, msg):
+        if self.thread is None:
+            print(msg, file=self.stream, flush=True)
+        else:
+            self.messages.put(msg)
+
+    def start(self):
+        self._stop.clear()
+        self.thread = threading.Thread(target=self._run, name="progress", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Print what is still queued, draw the footer a last time and hand stdout back."""
+        if self.thread is None:
+            return
+        self._stop.set()
+        self.thread.join()
+        self.thread = None
+        if self._drawn:
+            self.stream.write('\n')
+            self.stream.flush()
+        self._drawn = []
+
+    def _run(self):
+        last_summary = time.monotonic()
+        while True:
+            stopping = self._stop.wait(self.interval)
+            messages = self._drain()
+            if self.tty:
+                self._draw(messages)
+            else:
+                for msg in messages:
+                    self.stream.write(msg + '\n')
+                now = time.monotonic()
+                if stopping or now - last_summary >= self.summary_interval:
+                    last_summary = now
+                    for line in self.footer(shutil.get_terminal_size().columns):
+                        self.stream.write(line + '\n')
+                self.stream.flush()
+            if stopping:
+                return
+
+    def _drain(self):
+        messages = []
+        while True:
+            try:
+                messages.append(self.messages.get_nowait())
+            except queue.Empty:
+                return messages
+
+    def _draw(self, messages):
+        columns = shutil.get_terminal_size().columns
+        lines = [line[:columns - 1] for line in self.footer(columns)]
+        if not messages and lines == self._drawn:
+            return
+        out = []
+        if self._drawn:
+            # Back to the start of the footer, log lines overwrite it and it is drawn again below them
+            out.append('\r' + '\033[F' * (len(self._drawn) - 1))
+        for msg in messages:
+            out.append(msg + '\033[K\n')
+        out.append('\033[K\n'.join(lines) + '\033[K')
+        self.stream.write(''.join(out))
+        self.stream.flush()
+        self._drawn = lines
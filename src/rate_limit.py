@@ -0,0 +1,122 @@
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+
+class AdaptiveRateLimiter:
+    """
+    Token bucket for one host whose rate adapts AIMD style: every success adds a little rate back,
+    a throttle episode (429/5xx) halves it once. A Retry-After from the host holds every request
+    back until it has passed.
+    Callers reserve a token and get back how long to wait, so nobody has to sleep while holding a thread.
+    The bucket goes at most one burst into debt; past that, reserve() hands out no token and the caller
+    asks again when the wait is up, so waits are worked out at the rate of that moment, not a stale one.
+    """
+
+    def __init__(self, rate, min_rate=0.2, max_rate=None, burst=None):
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate or rate * 4
+        self.increase = max(self.rate / 20, 0.05)
+        self.burst = burst or max(1.0, rate)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0 # Retry-After deadline
+        self.backed_off = float('-inf') # When the rate was last halved
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        # No refill while a Retry-After is running, so it doesn't end in a burst
+        if now > self.updated:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def reserve(self):
+        """
+        Ask for a token, returns (taken, wait): with taken the token can be used after wait seconds (0 = now),
+        otherwise there is none to give yet and the caller should call reserve() again after wait seconds.
+        """
+        with self.lock:
+            now = time.monotonic()
+            if now < self.blocked_until:
+                return False, self.blocked_until - now
+            self._refill(now)
+            # Debt is capped at one burst, or a second's worth at the current rate if that is less
+            max_debt = min(self.burst, max(1.0, self.rate))
+            short = 1 - max_debt - self.tokens
+            if short > 1e-6: # Not float dust, or a caller could be told to wait 1e-14s forever
+                return False, short / self.rate
+            self.tokens -= 1
+            return True, 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def on_success(self):
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def on_throttle(self, retry_after=None, sent=None):
+        """
+        Back off after a 429/5xx for a request sent at sent (time.monotonic()), returns the seconds the host
+        asked us to wait (or None). Responses to requests sent before the last back off belong to the same
+        throttle episode and don't halve the rate again.
+        """
+        with self.lock:
+            now = time.monotonic()
+            self._refill(now)
+            if sent is None or sent >= self.backed_off:
+                self.rate = max(self.min_rate, self.rate / 2)
+                self.backed_off = now
+            # Drop any saved up burst so the lower rate applies straight away
+            self.tokens = min(self.tokens, 0)
+            wait = parse_retry_after(retry_after)
+            if wait is not None:
+                self.blocked_until = max(self.blocked_until, now + wait)
+                self.updated = max(self.updated, self.blocked_until)
+            return wait
+
+
+def parse_retry_after(value):
+    """Retry-After is either a number of seconds or an HTTP date."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+_initial_rate = 20.0
+_host_rates = {}
+
+
+def configure_limits(rate, host_rates=None):
+    """Set the starting requests/second for every host (host_rates overrides it per host), existing limiters are dropped."""
+    global _initial_rate, _host_rates
+    with _limiters_lock:
+        _initial_rate = rate
+        _host_rates = dict(host_rates or {})
+        _limiters.clear()
+
+
+def get_limiter(url):
+    host = urlsplit(url).netloc
+    limiter = _limiters.get(host)
+    if limiter is None:
+        with _limiters_lock:
+            limiter = _limiters.get(host)
+            if limiter is None:
+                limiter = AdaptiveRateLimiter(_host_rates.get(host, _initial_rate))
+                _limiters[host] = limiter
+    return limiter
+
+
+def limiter_rates():
+    """Rate (requests/second) every host has adapted to so far."""
+    with _limiters_lock:
+        return {host: limiter.rate for host, limiter in _limiters.items()}
@@ -0,0 +1,84 @@
+import os
+from urllib.parse import urlsplit
+
+# Same file as image_utils.RB_PLACEHOLDER_PATH, spelled out so stats.py doesn't need the image stack
+RB_PLACEHOLDER_PATH = os.path.join(os.path.dirname(__file__), 'RB_PLACERHOLDER.png')
+
+# Every logo source, declared once. Keys:
+#   name         display name, also the key of per-source state (journal, metrics, placeholder index)
+#   short        abbreviation for the progress footer
+#   dir          folder the scraper saves <ICAO>.png files in
+#   repo_dir     folder in the airline-logos repo (sync_to_repo.py, stats.py)
+#   url          URL template, formatted with {icao} and/or {iata}
+#   index        "fr24": with --fr24-method scrape the URL comes from the FR24 airlines index instead
+#   miss_status  status codes meaning "no logo for this airline", recorded as misses
+#   placeholder  image file the source serves instead of a logo, or None
+#   rate         starting requests/second for the source's host, None to derive it from --threads/--delay
+SOURCES = [
+    {
+        "name": "FlightAware Logos",
+        "short": "FA",
+        "dir": "flightaware_logos",
+        "repo_dir": "flightaware_logos",
+        "url": "https://flightaware.com/images/airline_logos/90p/{icao}.png",
+        "miss_status": (404,),
+    },
+    {
+        "name": "RadarBox Banners",
+        "short": "RB Ban",
+        "dir": "radarbox_banners",
+        "repo_dir": "radarbox_banners",
+        "url": "https://cdn.radarbox.com/airlines/{icao}.png",
+        "miss_status": (404,),
+    },
+    {
+        "name": "RadarBox Logos",
+        "short": "RB Log",
+        "dir": "radarbox_logos",
+        "repo_dir": "radarbox_logos",
+        "url": "https://cdn.radarbox.com/airlines/sq/{icao}.png",
+        "miss_status": (404,),
+        "placeholder": RB_PLACEHOLDER_PATH,
+    },
+    {
+        "name": "FlightRadar24 Logos",
+        "short": "FR24",
+        "dir": "fr24_logos",
+        "repo_dir": "fr24_banners",
+        "url": "https://cdn.flightradar24.com/assets/airlines/logotypes/{iata}_{icao}.png",
+        "index": "fr24",
+        # FlightRadar24 returns 403 for missing images
+        "miss_status": (403, 404),
+    },
+    {
+        "name": "Avcodes UK Banners",
+        "short": "Av",
+        "dir": "avcodes_banners",
+        "repo_dir": "avcodes_banners",
+        "url": "https://www.avcodes.co.uk/images/logos/{icao}.png",
+        "miss_status": (404,),
+    },
+]
+
+DEFAULTS = {"index": None, "placeholder": None, "rate": None}
+for _source in SOURCES:
+    for _key, _value in DEFAULTS.items():
+        _source.setdefault(_key, _value)
+
+SOURCES_BY_NAME = {source["name"]: source for source in SOURCES}
+
+
+def host_of(source):
+    return urlsplit(source["url"]).netloc
+
+
+def url_builder(source):
+    """
+    url(iata, icao) for a source, with the template's format method looked up once.
+    Returns None when the airline lacks a code the template needs.
+    """
+    template = source["url"]
+    build = template.format
+    if "{iata}" in template:
+        return lambda iata, icao: build(iata=iata, icao=icao) if iata and icao else None
+    return lambda iata, icao: build(icao=icao) if icao else None
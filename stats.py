@@ -1,31 +1,102 @@
 import os
+import sys
+import json
 import argparse
+import contextlib
 from pathlib import Path
 from src.airline_opp_codes import get_airline_codes
+from src.config import CODES_CACHE_TTL
+from src.sources import SOURCES
+from src.dir_index import DirIndex
 
 # Default Paths
 DEFAULT_SCRAPER_DIR = Path(".")
 DEFAULT_REPO_DIR = Path("../airline-logos")
 
-# Mappings: Provider Name -> Subdirectory in both Scraper and Repo
-# Note: FR24 Logos scraper directory is 'fr24_logos'
-PROVIDERS = {
-    "FlightAware Logos": "flightaware_logos",
-    "RadarBox Banners": "radarbox_banners",
-    "RadarBox Logos": "radarbox_logos",
-    "FR24 Logos": "fr24_logos",
-    "Avcodes Banners": "avcodes_banners",
-}
-
-def count_files(directory):
-    if not directory.exists():
-        return 0, set()
-    files = {f.name for f in directory.glob("*.[pP][nN][gG]")}
-    return len(files), files
+# Provider Name -> (Subdirectory in Scraper, Subdirectory in Repo), from the source registry
+PROVIDERS = {source["name"]: (source["dir"], source["repo_dir"]) for source in SOURCES}
+
+# Local: In Scraper subdir
+# Repo: In Repo subdir
+# Net: Scraper - Repo
+# New: In Scraper but not Repo (To be synced)
+# Gap: In Repo but not Scraper (Missing from this run)
+# Legy: In Repo but NOT in Master List (Legacy data)
+# Fail: In Master List but NOT in Local (Scraper missed it)
+COLUMNS = ["local", "repo", "net", "new", "gap", "legy", "fail"]
+
+def normalise(code):
+    return code.strip().upper()
+
+def icao_set(directory):
+    """Normalised ICAOs of the logos in a folder, so ABC.png and abc.PNG are the same airline."""
+    return {normalise(stem) for stem in DirIndex(directory).stems()}
+
+def audit(master, scraper_dir, repo_base, providers=PROVIDERS):
+    """
+    Every provider's ICAO sets, read once, and the differences between them as set operations.
+    Returns {provider: {"local", "repo", "new", "gap", "legy", "fail"}} of ICAO sets.
+    """
+    results = {}
+    for name, (subdir, repo_subdir) in providers.items():
+        local = icao_set(scraper_dir / subdir)
+        repo = icao_set(repo_base / repo_subdir)
+        results[name] = {
+            "local": local,
+            "repo": repo,
+            "new": local - repo,
+            "gap": repo - local,
+            "legy": repo - master,
+            # Per provider, assumes the provider *should* have everything
+            "fail": master - local,
+        }
+    return results
+
+def counts(sets):
+    row = {column: len(sets[column]) for column in COLUMNS if column != "net"}
+    row["net"] = row["local"] - row["repo"]
+    return row
+
+def build_report(master, results):
+    """Machine-readable audit: counts per provider and in total, plus the ICAO lists behind them."""
+    providers = {}
+    totals = {column: 0 for column in COLUMNS}
+    for name, sets in results.items():
+        row = counts(sets)
+        for column in COLUMNS:
+            totals[column] += row[column]
+        providers[name] = dict(row, icaos={column: sorted(sets[column]) for column in ("new", "gap", "legy", "fail")})
+    # Airlines in the master list that no provider has a logo for
+    covered = set().union(*(sets["local"] for sets in results.values())) if results else set()
+    return {
+        "master": len(master),
+        "providers": providers,
+        "totals": totals,
+        "uncovered": sorted(master - covered),
+    }
+
+def print_table(report):
+    header = f"{'Provider':<20} | {'Local':>7} | {'Repo':>7} | {'Net':>7} | {'New':>7} | {'Gap':>7} | {'Legy':>7} | {'Fail':>7}"
+    print(header)
+    print("-" * len(header))
+
+    def line(name, row):
+        net_str = f"{row['net']:+d}" if row['net'] != 0 else "0"
+        return f"{name:<20} | {row['local']:>7} | {row['repo']:>7} | {net_str:>7} | {row['new']:>7} | {row['gap']:>7} | {row['legy']:>7} | {row['fail']:>7}"
+
+    for name, row in report["providers"].items():
+        print(line(name, row))
+    print("-" * len(header))
+    print(line("TOTAL", report["totals"]))
+    print("\nNote: 'Fail' represents airlines in Master List missing from that specific provider's local folder.")
+    print(f"{len(report['uncovered'])} airlines in the Master List have no logo from any provider.")
 
 def main():
     parser = argparse.ArgumentParser(description="Audit scraped assets against repository.")
     parser.add_argument("repo_path", nargs="?", default=str(DEFAULT_REPO_DIR), help="Path to airline-logos repo")
+    parser.add_argument("--refresh", action="store_true", help="Scrape the master list again instead of using the cached copy")
+    parser.add_argument("--json", action="store_true", help="Print the audit as JSON on stdout instead of the table")
+    parser.add_argument("--json-out", metavar="PATH", help="Also write the audit as JSON to PATH")
     args = parser.parse_args()
 
     repo_base = Path(args.repo_path)
@@ -33,72 +104,29 @@ def main():
         print(f"Error: Repository path not found: {repo_base}")
         return
 
-    # Fetch source list
-    print("Fetching master airline list (Wikipedia + FAA)...")
-    all_airlines = get_airline_codes()
-    source_icaos = set(a[1] for a in all_airlines)
-    print(f"Master List: {len(source_icaos)} unique ICAO codes.\n")
-
-    # Header
-    # Local: In Scraper subdir
-    # Repo: In Repo subdir
-    # Net: Scraper - Repo
-    # New: In Scraper but not Repo (To be synced)
-    # Gap: In Repo but not Scraper (Missing from this run)
-    # Legy: In Repo but NOT in Master List (Legacy data)
-    # Fail: In Master List but NOT in Local (Scraper missed it)
-    header = f"{'Provider':<20} | {'Local':>7} | {'Repo':>7} | {'Net':>7} | {'New':>7} | {'Gap':>7} | {'Legy':>7} | {'Fail':>7}"
-    print(header)
-    print("-" * len(header))
-
-    totals = {k: 0 for k in ["local", "repo", "net", "new", "gap", "legy", "fail"]}
-
-    for name, subdir in PROVIDERS.items():
-        local_path = DEFAULT_SCRAPER_DIR / subdir
-        repo_path = repo_base / subdir
-
-        cnt_l, set_l = count_files(local_path)
-        cnt_r, set_r = count_files(repo_path)
-
-        # New: To be added to repo
-        set_new = set_l - set_r
-        cnt_new = len(set_new)
-
-        # Gap: Exists in repo but missed in this run
-        set_gap = set_r - set_l
-        cnt_gap = len(set_gap)
-
-        # Legacy: In Repo but not in Master List
-        cnt_legy = 0
-        for f in set_r:
-            icao = Path(f).stem
-            if icao not in source_icaos:
-                cnt_legy += 1
-
-        # Failed: In Master List but not in Local
-        # (This is per provider, assumes provider *should* have everything)
-        cnt_fail = 0
-        for icao in source_icaos:
-            if f"{icao}.png" not in set_l and f"{icao}.PNG" not in set_l:
-                cnt_fail += 1
-
-        net = cnt_l - cnt_r
-        net_str = f"{net:+d}" if net != 0 else "0"
-
-        print(f"{name:<20} | {cnt_l:>7} | {cnt_r:>7} | {net_str:>7} | {cnt_new:>7} | {cnt_gap:>7} | {cnt_legy:>7} | {cnt_fail:>7}")
-
-        totals["local"] += cnt_l
-        totals["repo"] += cnt_r
-        totals["net"] += net
-        totals["new"] += cnt_new
-        totals["gap"] += cnt_gap
-        totals["legy"] += cnt_legy
-        totals["fail"] += cnt_fail
-
-    print("-" * len(header))
-    net_total_str = f"{totals['net']:+d}" if totals['net'] != 0 else "0"
-    print(f"{'TOTAL':<20} | {totals['local']:>7} | {totals['repo']:>7} | {net_total_str:>7} | {totals['new']:>7} | {totals['gap']:>7} | {totals['legy']:>7} | {totals['fail']:>7}")
-    print("\nNote: 'Fail' represents airlines in Master List missing from that specific provider's local folder.")
+    # With JSON on stdout, everything else goes to stderr
+    human = sys.stderr if args.json else sys.stdout
+    with contextlib.redirect_stdout(human):
+        # Fetch source list
+        print("Loading master airline list (Wikipedia + FAA, cached for 24h)...")
+        all_airlines = get_airline_codes(max_age=0 if args.refresh else CODES_CACHE_TTL)
+        master = {normalise(icao) for _, icao in all_airlines if icao}
+        print(f"Master List: {len(master)} unique ICAO codes.\n")
+
+        report = build_report(master, audit(master, DEFAULT_SCRAPER_DIR, repo_base))
+        if not args.json:
+            print_table(report)
+
+        if args.json_out:
+            tmp_path = args.json_out + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2)
+            os.replace(tmp_path, args.json_out)
+            print(f"Audit written to {args.json_out}")
+
+    if args.json:
+        json.dump(report, sys.stdout, indent=2)
+        print()
 
 if __name__ == "__main__":
     main()
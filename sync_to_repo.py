@@ -1,50 +1,75 @@
 import os
+import json
 import shutil
 import hashlib
 import argparse
+import concurrent.futures
 from pathlib import Path
-from PIL import Image, ImageChops
-
-# Configuration
-SOURCE_MAP = {
-    "flightaware_logos": "flightaware_logos",
-    "radarbox_banners": "radarbox_banners",
-    "radarbox_logos": "radarbox_logos",
-    "fr24_logos": "fr24_banners",  # Folder name mismatch handling
-    "avcodes_banners": "avcodes_banners"
-}
-
-def calculate_md5(file_path):
-    """Calculate and return the MD5 hash of a file."""
-    hash_md5 = hashlib.md5()
+from src.config import CACHE_DIR
+from src.image_utils import file_pixel_digest
+from src.sources import SOURCES
+
+# Configuration: scraper folder -> repo folder, from the source registry
+SOURCE_MAP = {source["dir"]: source["repo_dir"] for source in SOURCES}
+
+MANIFEST_FILE = ".manifest.json"
+# Manifests of the target folders live in the scraper's cache, not in the published repo:
+# their mtimes are machine-local and would change on every sync
+TARGET_MANIFEST_DIR = "sync_manifests"
+
+def calculate_fast_hash(file_path):
+    """BLAKE2b of the file contents, read in 1 MB chunks."""
+    hash_b2 = hashlib.blake2b(digest_size=16)
     try:
         with open(file_path, "rb") as f:
-            for chunk in iter(lambda: f.read(4096), b""):
-                hash_md5.update(chunk)
-        return hash_md5.hexdigest()
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                hash_b2.update(chunk)
+        return hash_b2.hexdigest()
     except FileNotFoundError:
         return None
 
-def images_are_visually_identical(file1, file2):
-    """Check if two images are visually identical using PIL."""
+def target_manifest_path(source_base, tgt_dir):
+    """Where the manifest of a target folder is kept: the scraper's cache, keyed by the folder's resolved path."""
+    key = hashlib.blake2b(str(tgt_dir.resolve()).encode(), digest_size=8).hexdigest()
+    return source_base / CACHE_DIR / TARGET_MANIFEST_DIR / f"{tgt_dir.name}-{key}.json"
+
+def load_manifest(path):
+    """Manifest file of a folder: {filename: {"size", "mtime_ns", "hash", "pixel_digest"}}."""
     try:
-        img1 = Image.open(file1)
-        img2 = Image.open(file2)
-        
-        # Must be same mode and dimensions
-        if img1.mode != img2.mode or img1.size != img2.size:
-            return False
-            
-        # Compare pixels
-        diff = ImageChops.difference(img1, img2)
-        if diff.getbbox() is None:
-            return True # Identical
-        return False
-    except Exception:
-        return False # Assume different on error (safe fallback)
-
-def sync_folders(source_base, target_base, dry_run=False):
-    """Sync files from source folders to target code folders based on map."""
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_manifest(path, manifest):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, sort_keys=True, separators=(",", ":"))
+    os.replace(tmp_path, path)
+
+def fresh_entry(manifest, filename, stat):
+    """Return the manifest entry for a file if its size and mtime still match, else None."""
+    entry = manifest.get(filename)
+    if entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+        return entry
+    return None
+
+def run_all(pool, fn, paths):
+    """Run fn over paths on the process pool (inline without one), results in input order."""
+    if pool is None:
+        return [fn(path) for path in paths]
+    return list(pool.map(fn, paths, chunksize=64))
+
+def copy_file(src_file, tgt_file):
+    shutil.copy2(src_file, tgt_file)
+    return tgt_file.stat().st_mtime_ns
+
+def sync_folders(source_base, target_base, dry_run=False, jobs=1):
+    """
+    Sync files from source folders to target code folders based on map.
+    With jobs > 1, hashing and image decoding are spread over a process pool of that size.
+    """
     
     source_base = Path(source_base).resolve()
     target_base = Path(target_base).resolve()
@@ -63,6 +88,21 @@ def sync_folders(source_base, target_base, dry_run=False):
 
     stats = {"added": 0, "updated": 0, "skipped": 0, "errors": 0}
 
+    pool = concurrent.futures.ProcessPoolExecutor(max_workers=jobs) if jobs > 1 else None
+    try:
+        _sync_all(source_base, target_base, dry_run, jobs, pool, stats)
+    finally:
+        if pool:
+            pool.shutdown()
+
+    print("-" * 60)
+    print("Sync Complete.")
+    print(f"Added:   {stats['added']}")
+    print(f"Updated: {stats['updated']}")
+    print(f"Skipped: {stats['skipped']}")
+    print(f"Errors:  {stats['errors']}")
+
+def _sync_all(source_base, target_base, dry_run, jobs, pool, stats):
     for src_dir_name, tgt_dir_name in SOURCE_MAP.items():
         src_dir = source_base / src_dir_name
         tgt_dir = target_base / tgt_dir_name
@@ -82,64 +122,111 @@ def sync_folders(source_base, target_base, dry_run=False):
                 continue
 
         print(f"\nProcessing {src_dir_name} -> {tgt_dir_name}...")
-        
-        # Get list of files in source
-        files = [f for f in os.listdir(src_dir) if f.lower().endswith('.png')]
-        
-        for filename in files:
-            src_file = src_dir / filename
-            tgt_file = tgt_dir / filename
-
-            # Calculate content hash
-            src_hash = calculate_md5(src_file)
+
+        # Manifests record size, mtime and hashes, so only files whose stat changed get reread
+        tgt_manifest_path = target_manifest_path(source_base, tgt_dir)
+        src_manifest = load_manifest(src_dir / MANIFEST_FILE)
+        tgt_manifest = load_manifest(tgt_manifest_path) if tgt_dir.exists() else {}
+
+        # Get list of files in source (scandir hands back the stat without extra syscalls on most platforms)
+        with os.scandir(src_dir) as it:
+            files = sorted((e.name, e.stat()) for e in it if e.name.lower().endswith('.png') and e.is_file())
+
+        # Pass 1: stat both sides and hash whatever changed since the manifests were written
+        src_entries, tgt_entries, tgt_stats = {}, {}, {}
+        stale = [] # (manifest, entries, filename, path, stat)
+        for filename, src_stat in files:
+            entry = fresh_entry(src_manifest, filename, src_stat)
+            if entry:
+                src_entries[filename] = entry
+            else:
+                stale.append((src_manifest, src_entries, filename, src_dir / filename, src_stat))
+            try:
+                tgt_stat = (tgt_dir / filename).stat()
+            except FileNotFoundError:
+                continue
+            tgt_stats[filename] = tgt_stat
+            entry = fresh_entry(tgt_manifest, filename, tgt_stat)
+            if entry:
+                tgt_entries[filename] = entry
+            else:
+                stale.append((tgt_manifest, tgt_entries, filename, tgt_dir / filename, tgt_stat))
+
+        hashes = run_all(pool, calculate_fast_hash, [item[3] for item in stale])
+        for (manifest, entries, filename, _, stat), file_hash in zip(stale, hashes):
+            entry = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "hash": file_hash}
+            manifest[filename] = entry
+            entries[filename] = entry
+
+        # Pass 2: decode images whose bytes differ, unless their pixel digest is already cached
+        undecoded = []
+        for filename, src_entry in src_entries.items():
+            tgt_entry = tgt_entries.get(filename)
+            if src_entry["hash"] and tgt_entry and src_entry["hash"] != tgt_entry["hash"]:
+                for entry, path in ((src_entry, src_dir / filename), (tgt_entry, tgt_dir / filename)):
+                    if "pixel_digest" not in entry:
+                        undecoded.append((entry, path))
+        digests = run_all(pool, file_pixel_digest, [path for _, path in undecoded])
+        for (entry, _), value in zip(undecoded, digests):
+            entry["pixel_digest"] = value
+
+        # Pass 3: decide in filename order so output and stats don't depend on scheduling
+        copies = [] # (filename, src_entry)
+        for filename, src_stat in files:
+            src_entry = src_entries[filename]
             
-            if not src_hash:
+            if not src_entry["hash"]:
                 print(f"Error checking source file {filename}")
                 stats["errors"] += 1
                 continue
 
-            if not tgt_file.exists():
+            tgt_entry = tgt_entries.get(filename)
+            if tgt_entry is None:
                 # NEW FILE
                 print(f"[NEW] {tgt_dir_name}/{filename}")
-                if not dry_run:
-                    shutil.copy2(src_file, tgt_file)
+                copies.append((filename, src_entry))
                 stats["added"] += 1
-            else:
-                # EXISTING FILE - CHECK HASH
-                tgt_hash = calculate_md5(tgt_file)
-                
-                if src_hash != tgt_hash:
-                    # Check if visually identical despite hash difference
-                    if images_are_visually_identical(src_file, tgt_file):
-                        # SKIP - Metadata only change
-                        # print(f"[SKIP] {filename} (Visual Match)") # Verbose
-                        stats["skipped"] += 1
-                    else:
-                        # UPDATED FILE - Real visual change
-                        src_size = src_file.stat().st_size
-                        tgt_size = tgt_file.stat().st_size
-                        diff = src_size - tgt_size
-                        print(f"[UPD] {tgt_dir_name}/{filename} (Real Diff: {diff:+d}B)")
-                        if not dry_run:
-                            shutil.copy2(src_file, tgt_file)
-                        stats["updated"] += 1
-                else:
-                    # SAME FILE
-                    # print(f"[SKIP] {filename}") # Verbose
+            elif src_entry["hash"] != tgt_entry["hash"]:
+                # Check if visually identical despite hash difference
+                src_pixels = src_entry.get("pixel_digest")
+                if src_pixels is not None and src_pixels == tgt_entry.get("pixel_digest"):
+                    # SKIP - Metadata only change
+                    # print(f"[SKIP] {filename} (Visual Match)") # Verbose
                     stats["skipped"] += 1
+                else:
+                    # UPDATED FILE - Real visual change
+                    diff = src_stat.st_size - tgt_stats[filename].st_size
+                    print(f"[UPD] {tgt_dir_name}/{filename} (Real Diff: {diff:+d}B)")
+                    copies.append((filename, src_entry))
+                    stats["updated"] += 1
+            else:
+                # SAME FILE
+                # print(f"[SKIP] {filename}") # Verbose
+                stats["skipped"] += 1
 
-    print("-" * 60)
-    print("Sync Complete.")
-    print(f"Added:   {stats['added']}")
-    print(f"Updated: {stats['updated']}")
-    print(f"Skipped: {stats['skipped']}")
-    print(f"Errors:  {stats['errors']}")
+        # Pass 4: copies are pure I/O, they go through a thread pool
+        if not dry_run and copies:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=max(4, jobs * 2)) as io_pool:
+                futures = [io_pool.submit(copy_file, src_dir / filename, tgt_dir / filename) for filename, _ in copies]
+                for (filename, src_entry), future in zip(copies, futures):
+                    try:
+                        tgt_manifest[filename] = dict(src_entry, mtime_ns=future.result())
+                    except Exception as e:
+                        print(f"Error copying {filename}: {e}")
+                        stats["errors"] += 1
+
+        # A dry run changes nothing on disk, manifests included
+        if not dry_run:
+            # Source manifest only keeps files that still exist
+            save_manifest(src_dir / MANIFEST_FILE, src_entries)
+            save_manifest(tgt_manifest_path, tgt_manifest)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Sync extracted logos to another repository.")
     parser.add_argument("target", help="Path to the target repository (e.g. ../airline-logos)")
     parser.add_argument("--dry-run", action="store_true", help="Show what would be done without making changes")
+    parser.add_argument("-j", "--jobs", type=int, default=1, help="Processes for hashing and image comparison (default: 1)")
     
     args = parser.parse_args()
     
-    sync_folders(".", args.target, args.dry_run)
+    sync_folders(".", args.target, args.dry_run, args.jobs)
@@ -0,0 +1,81 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from io import BytesIO
+
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("PIL")
+pytest.importorskip("requests")
+pytest.importorskip("bs4")
+
+from PIL import Image, ImageDraw
+
+from src import airline_logos as scraper
+from src.blob_store import BlobStore
+from src.dir_index import reset_dir_indexes
+from src.logo_cache import close_caches
+from src.phash import PlaceholderIndex
+
+SOURCE = "FlightAware Logos"
+
+
+def logo_png():
+    img = Image.new('RGBA', (180, 60), (255, 255, 255, 0))
+    draw = ImageDraw.Draw(img)
+    draw.rectangle((10, 10, 80, 50), fill=(200, 30, 30, 255))
+    draw.ellipse((100, 5, 170, 55), fill=(20, 40, 160, 255))
+    buffer = BytesIO()
+    img.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+class DropPlaceholdersTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.addCleanup(reset_dir_indexes)
+        self.addCleanup(close_caches)
+        scraper.args = scraper.parse_args(["-A"])
+        scraper.placeholder_index = PlaceholderIndex(cluster_size=3)
+        scraper.validate_pool = None
+        scraper.blob_store = None
+        scraper.dropped_placeholders.clear()
+        reset_dir_indexes()
+
+    def run_batch(self, icaos):
+        content = logo_png()
+        responses = [(200, content, os.path.join(self.dir, f"{icao}.png"), SOURCE, icao) for icao in icaos]
+        results = scraper.validate_responses(responses)
+        return [
+            scraper.store_logo(data, content, {}, path, SOURCE, icao) if data is not None else outcome
+            for (data, outcome), (_, _, path, _, icao) in zip(results, responses)
+        ]
+
+    def test_cluster_in_one_batch_is_never_saved(self):
+        # The cluster is recognised on the third copy, while the first two still wait for the write stage
+        icaos = ["AAA", "BBB", "CCC"]
+        outcomes = self.run_batch(icaos)
+        self.assertEqual(outcomes, ['placeholder'] * 3)
+        self.assertEqual([name for name in os.listdir(self.dir) if name.endswith('.png')], [])
+        close_caches()
+        with sqlite3.connect(os.path.join(self.dir, ".cache.sqlite")) as conn:
+            misses = {icao for icao, reason in conn.execute("SELECT icao, reason FROM misses") if reason == 'placeholder'}
+        self.assertEqual(misses, set(icaos))
+
+    def test_dropped_placeholders_leave_the_blob_store(self):
+        scraper.blob_store = BlobStore(os.path.join(self.dir, ".blobs"))
+        self.addCleanup(scraper.blob_store.close)
+        # The first two are saved before the third copy flags the cluster
+        self.assertEqual(self.run_batch(["AAA"]) + self.run_batch(["BBB"]), ['saved', 'saved'])
+        self.assertEqual(self.run_batch(["CCC"]), ['placeholder'])
+        self.assertIsNone(scraper.blob_store.hash_of(SOURCE, "AAA"))
+        self.assertEqual(scraper.blob_store.duplicates(), {})
+        self.assertFalse(os.path.exists(os.path.join(self.dir, "AAA.png")))
+
+
+if __name__ == '__main__':
+    unittest.main()
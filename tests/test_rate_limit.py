@@ -0,0 +1,92 @@
+import heapq
+import unittest
+from unittest import mock
+
+from src import rate_limit
+from src.rate_limit import AdaptiveRateLimiter
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class AdaptiveRateLimiterTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch.object(rate_limit.time, 'monotonic', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_throttle_episode_halves_rate_once(self):
+        limiter = AdaptiveRateLimiter(20)
+        sent = self.clock.now
+        self.clock.now += 0.1
+        # Every request in flight comes back 429 together
+        for _ in range(8):
+            limiter.on_throttle('1', sent)
+        self.assertEqual(limiter.rate, 10)
+        # A request sent after the back off starts a new episode
+        limiter.on_throttle('1', self.clock.now)
+        self.assertEqual(limiter.rate, 5)
+
+    def test_debt_is_capped_at_one_burst(self):
+        limiter = AdaptiveRateLimiter(20)
+        results = [limiter.reserve() for _ in range(400)]
+        taken = [wait for ok, wait in results if ok]
+        self.assertEqual(len(taken), 40) # The saved up burst plus one burst of debt
+        self.assertLessEqual(max(taken), 1.0)
+        self.assertTrue(all(wait > 0 for ok, wait in results if not ok))
+
+    def test_retry_after_holds_requests_back(self):
+        limiter = AdaptiveRateLimiter(20)
+        limiter.on_throttle('2', self.clock.now)
+        taken, wait = limiter.reserve()
+        self.assertFalse(taken)
+        self.assertAlmostEqual(wait, 2.0)
+        self.clock.now += wait
+        self.assertEqual(limiter.reserve(), (True, 0.1)) # At the halved rate
+
+    def test_recovers_from_429_burst(self):
+        # The scraper's scheduler in miniature: 400 queued downloads, 8 in flight at once, and a host
+        # that answers 10 requests in every 200 with 429 and Retry-After: 1
+        limiter = AdaptiveRateLimiter(20)
+        latency = 0.05
+        events = [(self.clock.now, i, None) for i in range(400)] # (due, task, sent time if in flight)
+        heapq.heapify(events)
+        in_flight, requests, done, longest_defer = 0, 0, 0, 0.0
+        while events:
+            self.clock.now, task, sent = heapq.heappop(events)
+            if sent is None:
+                if in_flight >= 8:
+                    heapq.heappush(events, (self.clock.now + 0.01, task, None))
+                    continue
+                taken, wait = limiter.reserve()
+                longest_defer = max(longest_defer, wait)
+                if not taken or wait > 0:
+                    # Real tasks holding a token skip reserve() when they come due, close enough here
+                    heapq.heappush(events, (self.clock.now + wait, task, None) if not taken else
+                                   (self.clock.now + wait + latency, task, self.clock.now + wait))
+                    in_flight += taken
+                    continue
+                in_flight += 1
+                heapq.heappush(events, (self.clock.now + latency, task, self.clock.now))
+                continue
+            in_flight -= 1
+            requests += 1
+            if requests % 200 < 10:
+                limiter.on_throttle('1', sent)
+                heapq.heappush(events, (self.clock.now, task, None))
+            else:
+                limiter.on_success()
+                done += 1
+        self.assertEqual(done, 400)
+        self.assertLess(longest_defer, 2.0)
+        self.assertLess(self.clock.now - 1000.0, 60)
+
+
+if __name__ == '__main__':
+    unittest.main()